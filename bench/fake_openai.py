@@ -0,0 +1,168 @@
+"""In-process stand-in for the OpenAI client, for benchmarks and offline runs.
+
+    from bench.fake_openai import FakeOpenAI
+    core.llm.set_client(FakeOpenAI(latency_ms=40, rate_limit=0.05))
+
+Embeddings are deterministic bag-of-words projections (texts sharing words land close
+together, so retrieval behaves sensibly), completions are canned per prompt type, and
+images are placeholder PNGs. Latency and HTTP 429 injection are configurable; injected
+429s carry a retry-after-ms header and subclass openai.RateLimitError when the SDK is
+installed, so core.llm's retry path runs exactly as it does against the real API.
+"""
+import re, json, time, random, struct, hashlib, threading, zlib
+from types import SimpleNamespace as NS
+from typing import Dict, Optional, Tuple
+
+_WORD_RE = re.compile(r"\w+")
+_slots: Dict[str, Tuple[int, float]] = {}   # word -> (hash, sign); keeps the stand-in cheap next to the code it measures
+
+def _slot(word: str) -> Tuple[int, float]:
+    s = _slots.get(word)
+    if s is None:
+        h = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+        s = _slots[word] = (h, 1.0 if (h >> 32) & 1 else -1.0)
+    return s
+
+def _rate_limit_error(retry_after_ms: int):
+    try:
+        from openai import RateLimitError as base
+    except Exception:   # SDK missing: still carries status_code, so callers see a 429
+        base = Exception
+
+    class FakeRateLimitError(base):
+        def __init__(self):
+            Exception.__init__(self, "Rate limit reached (injected)")
+            self.message = "Rate limit reached (injected)"
+            self.status_code = 429
+            self.body = None
+            self.response = NS(headers={"retry-after-ms": str(retry_after_ms)}, text=self.message)
+
+    return FakeRateLimitError()
+
+def placeholder_png(width: int = 1024, height: int = 1024, seed: int = 0) -> bytes:
+    # Gradient plus noise: compresses like an illustration, unlike a flat fill
+    import numpy as np
+    img = np.zeros((height, width, 3), dtype=np.uint8)
+    img[..., 0] = np.linspace(0, 255, width, dtype=np.uint8)[None, :]
+    img[..., 1] = np.linspace(0, 255, height, dtype=np.uint8)[:, None]
+    img ^= np.random.default_rng(seed).integers(0, 16, img.shape, dtype=np.uint8)
+    raw = np.hstack([np.zeros((height, 1), dtype=np.uint8), img.reshape(height, -1)]).tobytes()
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", ihdr) + chunk(b"IDAT", zlib.compress(raw, 6)) + chunk(b"IEND", b"")
+
+
+class _Faults:
+    def __init__(self, latency_ms: float, jitter_ms: float, rate_limit: float, retry_after_ms: int, seed: int):
+        self.latency_ms, self.jitter_ms = latency_ms, jitter_ms
+        self.rate_limit, self.retry_after_ms = rate_limit, retry_after_ms
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls: Dict[str, int] = {}
+        self.throttled: Dict[str, int] = {}
+
+    def hit(self, kind: str, extra_ms: float = 0.0):
+        with self._lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+            throttle = self._rnd.random() < self.rate_limit
+            delay = self.latency_ms + extra_ms + self._rnd.uniform(0, self.jitter_ms)
+            if throttle:
+                self.throttled[kind] = self.throttled.get(kind, 0) + 1
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+        if throttle:
+            raise _rate_limit_error(self.retry_after_ms)
+
+
+class _Embeddings:
+    def __init__(self, owner: "FakeOpenAI"):
+        self._o = owner
+
+    def create(self, model: str, input, dimensions: Optional[int] = None, **_):
+        import numpy as np
+        texts = [input] if isinstance(input, str) else list(input)
+        self._o.faults.hit("embeddings", self._o.per_item_ms * len(texts))
+        dim = dimensions or self._o.dim
+        out, tokens = [], 0
+        for i, t in enumerate(texts):
+            v = np.zeros(dim, dtype="float32")
+            words = _WORD_RE.findall(t.lower())
+            tokens += len(words)
+            for w in words:
+                h, sign = _slot(w)
+                v[h % dim] += sign
+            v[0] += 1e-3   # never all-zero
+            out.append(NS(index=i, embedding=v.tolist()))
+        return NS(data=out, model=model, usage=NS(prompt_tokens=tokens, total_tokens=tokens))
+
+
+class _Completions:
+    def __init__(self, owner: "FakeOpenAI"):
+        self._o = owner
+
+    def _reply(self, messages) -> str:
+        prompt = str(messages[-1].get("content", ""))
+        if "Return JSON only" in prompt and "EXCERPT" in prompt:
+            return json.dumps({"benefits": ["Processing time fell 40%"], "implementation": ["Rolled out over 6 months"]})
+        if "Return JSON only" in prompt:
+            return json.dumps({k: f"{k.title()} text." for k in
+                               ("title", "summary", "problem", "implementation", "benefits", "learnings", "poc", "visuals")})
+        if "bullet questions" in prompt:
+            return "- What was the project timeline?\n- Who is the point of contact?"
+        if "diagrams/flowcharts" in prompt:
+            return "- Process flow of the new workflow\n- Before/after processing time\n- Governance structure"
+        return self._o.reply_text
+
+    def create(self, model: str, messages, stream: bool = False, **_):
+        text = self._reply(messages)
+        self._o.faults.hit("chat")
+        usage = NS(prompt_tokens=sum(len(_WORD_RE.findall(str(m.get("content", "")))) for m in messages),
+                   completion_tokens=len(_WORD_RE.findall(text)))
+        if not stream:
+            return NS(choices=[NS(message=NS(content=text))], usage=usage)
+        words = re.findall(r"\S+\s*", text)
+        per_token = self._o.stream_token_ms / 1000.0
+
+        def events():
+            for w in words:
+                if per_token:
+                    time.sleep(per_token)
+                yield NS(choices=[NS(delta=NS(content=w))])
+        return events()
+
+
+class _Images:
+    def __init__(self, owner: "FakeOpenAI"):
+        self._o = owner
+        self._cache: Dict[str, str] = {}
+
+    def generate(self, model: str, prompt: str, size: str = "1024x1024", **_):
+        import base64
+        self._o.faults.hit("images")
+        if size not in self._cache:
+            w, h = (int(x) for x in size.split("x"))
+            self._cache[size] = base64.b64encode(placeholder_png(w, h)).decode()
+        return NS(data=[NS(b64_json=self._cache[size])])
+
+
+class FakeOpenAI:
+    """Drop-in for the parts of openai.OpenAI that core.llm uses."""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, per_item_ms: float = 0.0,
+                 rate_limit: float = 0.0, retry_after_ms: int = 20, stream_token_ms: float = 0.0,
+                 dim: int = 256, seed: int = 0, reply_text: Optional[str] = None):
+        self.faults = _Faults(latency_ms, jitter_ms, rate_limit, retry_after_ms, seed)
+        self.per_item_ms = per_item_ms
+        self.stream_token_ms = stream_token_ms
+        self.dim = dim
+        self.reply_text = reply_text or "# Case Study\n\n## Executive Summary\nA placeholder draft.\n"
+        self.embeddings = _Embeddings(self)
+        self.chat = NS(completions=_Completions(self))
+        self.images = _Images(self)
+
+    def with_options(self, **_):
+        return self
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {"calls": dict(self.faults.calls), "throttled": dict(self.faults.throttled)}
@@ -0,0 +1,58 @@
+"""Import-time budget for the core modules.
+
+    python bench/import_budget.py [--budget-ms 400] [--runs 3]
+
+Each module is imported in a fresh interpreter (best of --runs). The check fails if
+an import exceeds the budget or drags in a heavy dependency that only the code paths
+actually using it should load (faiss, numpy, openai, streamlit, PyPDF2, docx, PIL).
+Exit code is non-zero on any violation, so it can gate CI.
+"""
+import os, sys, json, argparse, subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ["core.config", "core.prompts", "core.utils", "core.llm", "core.chunking", "core.extract",
+           "core.ann", "core.rag", "core.images", "core.export", "core.batch"]
+HEAVY = ["faiss", "numpy", "openai", "streamlit", "PyPDF2", "docx", "PIL", "tiktoken"]
+
+_PROBE = """
+import sys, json, time
+t0 = time.perf_counter()
+import {mod}
+ms = 1000.0 * (time.perf_counter() - t0)
+print(json.dumps({{"ms": ms, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+def measure(mod: str, runs: int = 3) -> dict:
+    best = None
+    for _ in range(max(1, runs)):
+        out = subprocess.run([sys.executable, "-c", _PROBE.format(mod=mod, heavy=HEAVY)], cwd=ROOT,
+                             capture_output=True, text=True, env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"})
+        if out.returncode:
+            return {"module": mod, "error": out.stderr.strip().splitlines()[-1] if out.stderr else "failed"}
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        if best is None or r["ms"] < best["ms"]:
+            best = r
+    return {"module": mod, **best}
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--budget-ms", type=float, default=400.0, help="per-module import budget (default: 400)")
+    ap.add_argument("--runs", type=int, default=3, help="fresh interpreters per module; best is kept (default: 3)")
+    ap.add_argument("modules", nargs="*", default=MODULES)
+    args = ap.parse_args(argv)
+    failed = 0
+    for mod in args.modules:
+        r = measure(mod, args.runs)
+        if "error" in r:
+            failed += 1
+            print(f"FAIL {mod:14s} {r['error']}")
+            continue
+        bad = r["ms"] > args.budget_ms or r["heavy"]
+        failed += bool(bad)
+        heavy = f"  pulled in: {', '.join(r['heavy'])}" if r["heavy"] else ""
+        print(f"{'FAIL' if bad else 'ok  '} {mod:14s} {r['ms']:7.1f} ms{heavy}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
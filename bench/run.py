@@ -0,0 +1,266 @@
+"""Offline benchmarks for the ingest, retrieval and export paths (no API key needed).
+
+    python -m bench.run [--sizes 1000 5000 20000] [--out bench/results/latest.json]
+                        [--baseline bench/baselines/reference.json] [--tolerance 0.3]
+                        [--latency-ms 0] [--rate-limit 0.0]
+
+Runs in a throwaway working directory against bench.fake_openai.FakeOpenAI, so the
+numbers cover LEAPscribe's own code plus whatever latency/429s are injected. Results
+are a flat {metric: value} map; with --baseline the run is compared metric by metric
+and exits non-zero when anything regressed by more than --tolerance. Metric suffixes
+give the direction: *_per_s higher is better; *_ms, *_s and *_bytes lower is better.
+"""
+import os, sys, json, time, random, shutil, argparse, platform, tempfile, subprocess
+from io import BytesIO
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from bench.fake_openai import FakeOpenAI, placeholder_png
+
+# ---- Synthetic corpus ----
+def _vocab(n: int = 6000, seed: int = 7) -> List[str]:
+    rnd = random.Random(seed)
+    sy = ["ba", "ko", "ri", "mu", "ten", "sa", "lo", "vi", "dar", "pe", "qu", "nor", "fi", "zel", "ha", "gu"]
+    words = {"".join(rnd.choice(sy) for _ in range(rnd.randint(1, 4))) for _ in range(n * 2)}
+    return sorted(words)[:n]
+
+_VOCAB = _vocab()
+_WEIGHTS = [1.0 / (r + 1) for r in range(len(_VOCAB))]   # Zipf-like, as in real prose
+
+def synth_pages(n_pages: int, seed: int, words_per_page: int = 450) -> List[str]:
+    rnd = random.Random(seed)
+    pages = []
+    for p in range(n_pages):
+        paras = [f"Section {p + 1}: {' '.join(rnd.choices(_VOCAB, _WEIGHTS, k=3)).title()}"]
+        left = words_per_page
+        while left > 0:
+            n = min(left, rnd.randint(40, 120))
+            words = rnd.choices(_VOCAB, _WEIGHTS, k=n)
+            paras.append(" ".join(words).capitalize() + f". Budget {rnd.randint(1, 999)}.{rnd.randint(0, 99):02d} million.")
+            left -= n
+        pages.append("\n\n".join(paras))
+    return pages
+
+def make_pdf(pages: List[str], width: int = 95) -> bytes:
+    # Minimal text-only PDF (Helvetica, one content stream per page) that PyPDF2 can extract
+    import textwrap
+    objs: List[bytes] = [b"<< /Type /Catalog /Pages 2 0 R >>", b"", b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        lines = [l for para in text.split("\n\n") for l in (textwrap.wrap(para, width) + [""])][:64]
+        esc = lambda s: s.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+        stream = ("BT /F1 9 Tf 11 TL 40 800 Td\n" + "".join(f"({esc(l)}) '\n" for l in lines) + "ET").encode("latin-1", "replace")
+        objs.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objs.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> "
+                    b"/Contents %d 0 R >>" % len(objs))
+        kids.append(len(objs))
+    objs[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % k for k in kids), len(kids))
+    out, offsets = BytesIO(), []
+    out.write(b"%PDF-1.4\n")
+    for i, body in enumerate(objs, 1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % i + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1))
+    out.write(b"".join(b"%010d 00000 n \n" % o for o in offsets))
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objs) + 1, xref))
+    return out.getvalue()
+
+def make_docx(pages: List[str]) -> bytes:
+    from docx import Document
+    doc = Document()
+    for text in pages:
+        head, *paras = text.split("\n\n")
+        doc.add_heading(head, level=2)
+        for para in paras:
+            doc.add_paragraph(para)
+    buf = BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+def _pct(values: List[float], q: float) -> float:
+    s = sorted(values)
+    return s[min(len(s) - 1, int(round(q * (len(s) - 1))))] if s else 0.0
+
+def _best(fn, repeat: int):
+    # Fastest of `repeat` runs: the least noisy estimate of what the code itself costs
+    best, out = float("inf"), None
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+# ---- Benchmarks ----
+def bench_extract(m: Dict, pages: int, repeat: int):
+    from core.rag import extract_text
+    from core.extract import new_report
+    text_pages = synth_pages(pages, seed=1)
+    files = {"pdf": make_pdf(text_pages), "docx": make_docx(text_pages), "txt": "\n\n".join(text_pages).encode()}
+    for ext, data in files.items():
+        extract_text(data, f"warm.{ext}")   # first call pays for imports / the PDF worker pool
+        report = new_report(f"bench.{ext}")
+        dt, text = _best(lambda: extract_text(data, f"bench.{ext}"), repeat)
+        extract_text(data, f"bench.{ext}", report)
+        m[f"extract.{ext}_ms"] = 1000.0 * dt
+        if ext != "txt":   # a plain decode: rates at this scale are timer noise
+            m[f"extract.{ext}.pages_per_s"] = report["pages"] / dt
+            m[f"extract.{ext}.mb_per_s"] = len(data) / 1e6 / dt
+            m[f"extract.{ext}.chars_per_s"] = len(text) / dt
+
+def bench_chunk(m: Dict, pages: int, repeat: int):
+    from core.rag import chunk
+    text = "\f".join(synth_pages(pages, seed=2))
+    dt, chunks = _best(lambda: chunk(text), repeat)
+    m["chunk_ms"] = 1000.0 * dt
+    m["chunk.mb_per_s"] = len(text.encode()) / 1e6 / dt
+    m["chunk.chunks_per_s"] = len(chunks) / dt
+
+def bench_corpus(m: Dict, sizes: List[int], n_queries: int):
+    from core import rag
+    rnd = random.Random(3)
+    total, doc_no = 0, 0
+    for size in sorted(sizes):
+        t_ingest, added = 0.0, 0
+        while total < size:
+            docs = []
+            for _ in range(20):
+                doc_no += 1
+                docs.append({"text": "\f".join(synth_pages(4, seed=1000 + doc_no)),
+                             "meta": {"filename": f"doc{doc_no}.pdf", "source": f"agency{doc_no % 7}"}})
+            before = len(rag.chunks_for({}))
+            t0 = time.perf_counter()
+            rag.upsert_documents(docs)
+            t_ingest += time.perf_counter() - t0
+            now = len(rag.chunks_for({}))
+            added += now - before
+            total = now
+        m[f"upsert.n{size}.chunks_per_s"] = added / t_ingest if t_ingest else 0.0
+        queries = [" ".join(rnd.choices(_VOCAB[:800], k=4)) + f" {size}" for _ in range(n_queries)]
+        for mode in ("dense", "lexical", "hybrid"):
+            lat = []
+            for q in queries:
+                t0 = time.perf_counter()
+                rag.query(q, k=8, mode=mode)
+                lat.append(1000.0 * (time.perf_counter() - t0))
+            m[f"query.{mode}.n{size}_p50_ms"] = _pct(lat, 0.5)
+            m[f"query.{mode}.n{size}_p95_ms"] = _pct(lat, 0.95)
+        lat = []
+        for q in queries:
+            t0 = time.perf_counter()
+            rag.build_context(q)
+            lat.append(1000.0 * (time.perf_counter() - t0))
+        m[f"context.n{size}_p50_ms"] = _pct(lat, 0.5)
+        m[f"corpus.n{size}.chunks"] = total
+
+def bench_export(m: Dict, repeat: int):
+    from core.export import build_docx_from_sections, parse_sections, suggest_section_for_prompt, COVER_KEY
+    md = "# Bench Case Study\n\n" + "\n\n".join(f"## {s}\n" + "\n\n".join(synth_pages(1, seed=50 + i))
+                                               for i, s in enumerate(["Executive Summary", "Problem / Need",
+                                                                      "Implementation Approach", "Benefits & Impact"]))
+    cover = placeholder_png(1536, 1024, seed=1)
+    diags = {p: placeholder_png(seed=i + 2) for i, p in enumerate(["process workflow", "benefits kpi chart", "lessons timeline"])}
+    placement = {p: suggest_section_for_prompt(p) for p in diags}
+    placement[COVER_KEY] = "Title"
+    for label, dpi in (("print", 150), ("raw", None)):
+        dt, buf = _best(lambda: build_docx_from_sections(parse_sections(md), placement, cover, diags, dpi=dpi), repeat)
+        m[f"export.docx_{label}_ms"] = 1000.0 * dt
+        m[f"export.docx_{label}.size_bytes"] = len(buf.getvalue())
+
+# ---- Baselines ----
+NOISE_MS = 2.0   # timings this short swing by more than any tolerance
+
+def _direction(metric: str) -> int:
+    if metric.endswith("_per_s"):
+        return 1
+    if metric.endswith(("_ms", "_s", "_bytes")):
+        return -1
+    return 0
+
+def compare(current: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> List[str]:
+    regressions = []
+    print(f"\n{'metric':42s} {'baseline':>12s} {'current':>12s} {'change':>8s}")
+    for k in sorted(set(current) & set(baseline)):
+        base, cur, d = baseline[k], current[k], _direction(k)
+        change = (cur - base) / base if base else 0.0
+        worse = d and change * d < -tolerance and not (k.endswith("_ms") and max(base, cur) < NOISE_MS)
+        if worse:
+            regressions.append(k)
+        print(f"{k:42s} {base:12.3f} {cur:12.3f} {change:+7.0%}{'  REGRESSION' if worse else ''}")
+    return regressions
+
+def _git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except Exception:
+        return ""
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m bench.run", description="Offline LEAPscribe benchmarks.")
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000], help="corpus sizes in chunks")
+    ap.add_argument("--pages", type=int, default=60, help="pages per extract/chunk document (default: 60)")
+    ap.add_argument("--repeat", type=int, default=3, help="runs per extract/chunk/export timing, fastest kept (default: 3)")
+    ap.add_argument("--queries", type=int, default=50, help="queries per corpus size and mode (default: 50)")
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="injected latency per API call")
+    ap.add_argument("--rate-limit", type=float, default=0.0, help="fraction of API calls answered with 429")
+    ap.add_argument("--rate-limited", action="store_true",
+                    help="keep the shared API rate limiter on (off by default: the stand-in has no quota)")
+    ap.add_argument("--dim", type=int, default=256, help="embedding dimensions of the stand-in (default: 256)")
+    ap.add_argument("--out", default=os.path.join(ROOT, "bench", "results", "latest.json"))
+    ap.add_argument("--baseline", help="baseline JSON to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.3, help="allowed relative slowdown (default: 0.3)")
+    ap.add_argument("--keep", action="store_true", help="keep the scratch working directory")
+    args = ap.parse_args(argv)
+    out_path = os.path.abspath(args.out)
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+
+    # Everything under data/ lands in a scratch dir: cold caches, empty index
+    work = tempfile.mkdtemp(prefix="leapscribe-bench-")
+    cwd = os.getcwd()
+    os.chdir(work)
+    try:
+        from core import config
+        config.configure(SCHED_ENABLED="1" if args.rate_limited else "0")
+        from core import llm
+        fake = FakeOpenAI(latency_ms=args.latency_ms, rate_limit=args.rate_limit, dim=args.dim)
+        llm.set_client(fake)
+        metrics: Dict[str, float] = {}
+        t0 = time.perf_counter()
+        for name, fn in (("extract", lambda: bench_extract(metrics, args.pages, args.repeat)),
+                         ("chunk", lambda: bench_chunk(metrics, args.pages, args.repeat)),
+                         ("corpus", lambda: bench_corpus(metrics, args.sizes, args.queries)),
+                         ("export", lambda: bench_export(metrics, args.repeat))):
+            t = time.perf_counter()
+            fn()
+            print(f"{name:8s} {time.perf_counter() - t:7.1f}s", flush=True)
+        metrics["total.seconds"] = time.perf_counter() - t0   # informational: depends on --sizes
+    finally:
+        os.chdir(cwd)
+        if not args.keep:
+            shutil.rmtree(work, ignore_errors=True)
+
+    result = {
+        "meta": {"git": _git_rev(), "at": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                 "machine": platform.machine(), "cpus": os.cpu_count(), "params": {k: v for k, v in vars(args).items()
+                                                                                  if k not in ("out", "baseline", "keep")},
+                 "api_calls": fake.stats()},
+        "metrics": {k: round(v, 4) for k, v in metrics.items()},
+    }
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    with open(out_path, "w") as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+    print(f"wrote {out_path}")
+    if baseline_path:
+        with open(baseline_path) as f:
+            base = json.load(f)
+        regressions = compare(result["metrics"], base["metrics"], args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
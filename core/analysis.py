@@ -0,0 +1,97 @@
+import re, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+from core import config, scheduler, trace
+from core.llm import chat, CHAT_MODEL
+from core.tokens import count_tokens
+from core.utils import parse_questions_list, parse_json_object
+from core.prompts import CHECKLIST, coverage_map_prompt, coverage_gap_prompt
+
+# Map: chunks are packed into excerpts and reviewed in parallel against prompts.CHECKLIST.
+# Excerpts grow (up to ANALYSIS_MAX_BATCH_TOKENS) so a large upload still fits in about one wave of
+# ANALYSIS_CONCURRENCY calls; past that ceiling the number of waves, and wall-clock, grows.
+ANALYSIS_BATCH_TOKENS     = int(config.get("ANALYSIS_BATCH_TOKENS", 6000))
+ANALYSIS_MAX_BATCH_TOKENS = int(config.get("ANALYSIS_MAX_BATCH_TOKENS", 24000))
+ANALYSIS_CONCURRENCY      = int(config.get("ANALYSIS_CONCURRENCY", 8))
+FACTS_PER_SECTION         = int(config.get("ANALYSIS_FACTS_PER_SECTION", 12))
+
+def _excerpts(chunks: List[Dict], model: str) -> List[str]:
+    costs = [c.get("tokens") or count_tokens(c["text"], model) for c in chunks]
+    target = min(ANALYSIS_MAX_BATCH_TOKENS, max(ANALYSIS_BATCH_TOKENS, -(-sum(costs) // ANALYSIS_CONCURRENCY)))
+    out, cur, cur_tokens = [], [], 0
+    for c, n in zip(chunks, costs):
+        if cur and cur_tokens + n > target:
+            out.append("\n\n".join(cur))
+            cur, cur_tokens = [], 0
+        label = c.get("filename", "")
+        if c.get("page"):
+            label += f", p. {c['page']}"
+        cur.append(f"[{label}]\n{c['text']}" if label else c["text"])
+        cur_tokens += n
+    if cur:
+        out.append("\n\n".join(cur))
+    return out
+
+def _review(excerpt: str, model: str) -> Dict[str, List[str]]:
+    found = parse_json_object(chat([{"role": "user", "content": coverage_map_prompt(excerpt)}], model=model))
+    return {k: [str(f).strip() for f in (v if isinstance(v, list) else [v]) if str(f).strip()]
+            for k, v in found.items() if k in CHECKLIST}
+
+def _norm(fact: str) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", fact.lower()).strip()
+
+def merge_coverage(findings: List[Dict[str, List[str]]], per_section: int = FACTS_PER_SECTION) -> Dict[str, List[str]]:
+    # Reduce: union of facts per checklist section, near-verbatim repeats dropped, capped per section
+    coverage: Dict[str, List[str]] = {k: [] for k in CHECKLIST}
+    seen = {k: set() for k in CHECKLIST}
+    for found in findings:
+        for k, facts in found.items():
+            for f in facts:
+                key = _norm(f)
+                if key and key not in seen[k] and len(coverage[k]) < per_section:
+                    seen[k].add(key)
+                    coverage[k].append(f)
+    return coverage
+
+def coverage_text(coverage: Dict[str, List[str]]) -> str:
+    lines = []
+    for k, desc in CHECKLIST.items():
+        lines.append(f"{k} ({desc}):")
+        lines.extend(f"- {f}" for f in coverage.get(k) or ["(nothing found)"])
+    return "\n".join(lines)
+
+def analyze(chunks: List[Dict], model: str = CHAT_MODEL,
+            progress: Optional[Callable[[int, int], None]] = None) -> Dict:
+    """Map-reduce gap analysis over every chunk ({"text", ["filename", "page", "tokens"]}).
+
+    Returns {"questions_text", "questions", "coverage", "excerpts", "failed", "seconds"}.
+    """
+    t0 = time.perf_counter()
+    excerpts = _excerpts([c for c in chunks if c.get("text", "").strip()], model)
+    # Merged in excerpt order, so the same upload yields the same reduce prompt (and a chat cache hit)
+    findings: List[Dict[str, List[str]]] = [{} for _ in excerpts]
+    failed = []
+    if excerpts:
+        # The map fan-out yields to interactive drafting; the single reduce call below does not
+        with scheduler.priority(scheduler.BACKGROUND), ThreadPoolExecutor(max_workers=max(1, min(ANALYSIS_CONCURRENCY, len(excerpts)))) as pool:
+            futs = {pool.submit(trace.propagate(_review), e, model): i for i, e in enumerate(excerpts)}
+            for n, fut in enumerate(as_completed(futs), 1):
+                try:
+                    findings[futs[fut]] = fut.result()
+                except Exception as e:
+                    # One unreadable reply only loses that excerpt's facts
+                    failed.append(f"{type(e).__name__}: {e}")
+                if progress:
+                    progress(n, len(excerpts))
+        if len(failed) == len(excerpts):
+            raise RuntimeError(f"Gap analysis failed for every excerpt: {failed[0]}")
+    coverage = merge_coverage(findings)
+    qs = chat([{"role": "user", "content": coverage_gap_prompt(coverage_text(coverage))}], model=model)
+    return {
+        "questions_text": qs,
+        "questions": parse_questions_list(qs),
+        "coverage": coverage,
+        "excerpts": len(excerpts),
+        "failed": failed,
+        "seconds": time.perf_counter() - t0,
+    }
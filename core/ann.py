@@ -0,0 +1,286 @@
+import time
+from core import config
+from typing import Dict, List, Optional
+
+# faiss and numpy are imported inside functions: pages that never search should not pay for them
+
+# "auto" stays on the exact flat index until the corpus reaches ANN_PROMOTE_AT vectors
+INDEX_BACKEND   = str(config.get("INDEX_BACKEND", "auto")).lower()
+ANN_PROMOTE_AT  = int(config.get("ANN_PROMOTE_AT", 20000))
+ANN_AUTO_KIND   = str(config.get("ANN_AUTO_KIND", "hnsw")).lower()
+HNSW_M          = int(config.get("HNSW_M", 32))
+HNSW_EF_BUILD   = int(config.get("HNSW_EF_CONSTRUCTION", 80))
+HNSW_EF_SEARCH  = int(config.get("HNSW_EF_SEARCH", 64))
+IVF_NLIST       = int(config.get("IVF_NLIST", 0))          # 0 -> ~4*sqrt(n)
+IVF_NPROBE      = int(config.get("IVF_NPROBE", 16))
+IVF_TRAIN_SIZE  = int(config.get("IVF_TRAIN_SAMPLE", 50000))
+# Vector codes the index holds: "flat" float32, "fp16" / "sq8" scalar-quantized (2x / 4x smaller), "pq" product
+# codes of PQ_M bytes (0 -> dim/4, 16x smaller). Corpora under CODEC_MIN_ROWS stay flat
+INDEX_CODEC     = str(config.get("INDEX_CODEC", "flat")).lower()
+CODEC_MIN_ROWS  = int(config.get("CODEC_MIN_ROWS", 1000))
+PQ_M            = int(config.get("PQ_M", 0))
+PQ_MIN_ROWS     = 39 * 256   # k-means wants ~39 training points per centroid; smaller corpora get sq8
+# Candidates fetched per result from a compressed index and rescored from full-precision vectors (0 = off)
+RERANK_FACTOR   = int(config.get("RERANK_FACTOR", 4))
+
+BACKENDS = ("flat", "hnsw", "ivf")
+CODECS = ("flat", "fp16", "sq8", "pq")
+_SQ_TYPES = {"fp16": "QT_fp16", "sq8": "QT_8bit"}
+
+def choose_backend(n: int) -> str:
+    if INDEX_BACKEND in BACKENDS:
+        return INDEX_BACKEND
+    return ANN_AUTO_KIND if n >= ANN_PROMOTE_AT else "flat"
+
+def fit_codec(codec: str, n: int) -> str:
+    if codec == "pq" and n < PQ_MIN_ROWS:
+        codec = "sq8"
+    return codec if codec in CODECS and n >= CODEC_MIN_ROWS else "flat"
+
+def choose_codec(n: int) -> str:
+    return fit_codec(INDEX_CODEC, n)
+
+def _pq_m(dim: int) -> int:
+    # Sub-quantizers must divide dim: largest divisor not above the target
+    target = min(dim, PQ_M or max(1, dim // 4))
+    return next(m for m in range(target, 0, -1) if dim % m == 0)
+
+def _inner(index):
+    # The search structure under any Layered / IndexIDMap wrapping
+    import faiss
+    if isinstance(index, Layered):
+        index = index.base
+    inner = faiss.downcast_index(index)
+    if isinstance(inner, faiss.IndexIDMap):
+        inner = faiss.downcast_index(inner.index)
+    return inner
+
+def backend_of(index) -> str:
+    import faiss
+    if index is None:
+        return "flat"
+    inner = _inner(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+def codec_of(index) -> str:
+    import faiss
+    if index is None:
+        return "flat"
+    inner = _inner(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner = faiss.downcast_index(inner.storage)
+    if isinstance(inner, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    if isinstance(inner, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "fp16" if inner.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    return "flat"
+
+def _nlist_for(n: int) -> int:
+    import numpy as np
+    nlist = IVF_NLIST or int(4 * np.sqrt(max(n, 1)))
+    # FAISS wants ~39 training points per centroid
+    return max(1, min(nlist, n // 39 or 1))
+
+def new_index(dim: int, backend: str = "flat", n_hint: int = 0,
+              ef_search: Optional[int] = None, nprobe: Optional[int] = None, codec: str = "flat"):
+    import faiss
+    ip = faiss.METRIC_INNER_PRODUCT
+    qtype = getattr(faiss.ScalarQuantizer, _SQ_TYPES.get(codec, "QT_8bit"))
+    if backend == "hnsw":
+        if codec == "pq":
+            index = faiss.IndexHNSWPQ(dim, _pq_m(dim), HNSW_M, 8, ip)
+        elif codec in _SQ_TYPES:
+            index = faiss.IndexHNSWSQ(dim, qtype, HNSW_M, ip)
+        else:
+            index = faiss.IndexHNSWFlat(dim, HNSW_M, ip)
+        index.hnsw.efConstruction = HNSW_EF_BUILD
+        index.hnsw.efSearch = ef_search or HNSW_EF_SEARCH
+        return index
+    if backend == "ivf":
+        quantizer = faiss.IndexFlatIP(dim)
+        nlist = _nlist_for(n_hint)
+        if codec == "pq":
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_m(dim), 8, ip)
+        elif codec in _SQ_TYPES:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, qtype, ip)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, ip)
+        index.nprobe = nprobe or IVF_NPROBE
+        return index
+    if codec == "pq":
+        return faiss.IndexPQ(dim, _pq_m(dim), 8, ip)
+    if codec in _SQ_TYPES:
+        return faiss.IndexScalarQuantizer(dim, qtype, ip)
+    return faiss.IndexFlatIP(dim)
+
+def build_index(vecs: "np.ndarray", backend: str = "flat", ef_search: Optional[int] = None,
+                nprobe: Optional[int] = None, seed: int = 0, ids: Optional["np.ndarray"] = None,
+                codec: str = "flat"):
+    # With ids, the index is wrapped in an IndexIDMap and returns those ids (row numbers of vecs otherwise)
+    import faiss, numpy as np
+    n, dim = vecs.shape
+    if backend == "ivf" and n < 39:
+        backend = "flat"   # too small to train meaningful centroids
+    index = new_index(dim, backend, n, ef_search=ef_search, nprobe=nprobe, codec=codec)
+    if not index.is_trained:
+        # IVF centroids and SQ/PQ codebooks train on the same sample
+        rng = np.random.default_rng(seed)
+        sample = vecs if n <= IVF_TRAIN_SIZE else vecs[np.sort(rng.choice(n, IVF_TRAIN_SIZE, replace=False))]
+        index.train(np.ascontiguousarray(sample, dtype="float32"))
+    if ids is not None:
+        index = faiss.IndexIDMap(index)
+        if n:
+            index.add_with_ids(np.ascontiguousarray(vecs, dtype="float32"), np.asarray(ids, dtype="int64"))
+    elif n:
+        index.add(np.ascontiguousarray(vecs, dtype="float32"))
+    return index
+
+def open_snapshot(path: str):
+    # Memory-mapped and read-only where this FAISS build allows (processes then share the page cache
+    # instead of each holding a copy); older builds fall back to a plain in-RAM read
+    import faiss
+    for flag in ("IO_FLAG_MMAP_IFC", "IO_FLAG_MMAP"):
+        if hasattr(faiss, flag):
+            try:
+                return faiss.read_index(path, getattr(faiss, flag) | getattr(faiss, "IO_FLAG_READ_ONLY", 0))
+            except RuntimeError:
+                continue
+    return faiss.read_index(path)
+
+class Layered:
+    """A read-only snapshot index plus an in-RAM flat index of the rows appended after it; both return row ids."""
+
+    def __init__(self, base, delta_vecs: "np.ndarray", delta_ids: "np.ndarray"):
+        self.base = base
+        self.d = base.d
+        self.delta = build_index(delta_vecs, "flat", ids=delta_ids)
+
+    @property
+    def ntotal(self) -> int:
+        return self.base.ntotal + self.delta.ntotal
+
+    def add_with_ids(self, vecs: "np.ndarray", ids: "np.ndarray"):
+        self.delta.add_with_ids(vecs, ids)
+
+    def search(self, q: "np.ndarray", k: int):
+        import numpy as np
+        D = np.full((len(q), k), -np.inf, dtype="float32")
+        I = np.full((len(q), k), -1, dtype="int64")
+        for index in (self.base, self.delta):
+            kk = min(k, index.ntotal)
+            if not kk:
+                continue
+            d, i = index.search(q, kk)
+            D = np.hstack([D, d])
+            I = np.hstack([I, i])
+        top = np.argsort(-D, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(D, top, axis=1), np.take_along_axis(I, top, axis=1)
+
+def rerank(vecs: "np.ndarray", q: "np.ndarray", ids, k: int) -> List[int]:
+    # Exact inner products from full-precision rows (e.g. the memory-mapped vectors.f32) for a compressed
+    # index's candidates; ids are read in file order
+    import numpy as np
+    ids = np.unique(np.asarray(ids, dtype="int64"))
+    if not len(ids):
+        return []
+    scores = np.asarray(vecs[ids], dtype="float32") @ q
+    return [int(i) for i in ids[np.argsort(-scores, kind="stable")[:k]]]
+
+def shorten(vecs: "np.ndarray", dims: int) -> "np.ndarray":
+    # What the embeddings API's `dimensions` returns for text-embedding-3 models: leading components, renormalised
+    import numpy as np
+    out = np.array(vecs[:, :dims], dtype="float32")
+    out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+    return out
+
+def bytes_per_vector(index) -> float:
+    # Serialized size, so graph links, centroids and codebooks count too
+    import faiss
+    return faiss.serialize_index(index).nbytes / max(index.ntotal, 1)
+
+def recall_report(vecs: "np.ndarray", k: int = 10, n_queries: int = 200, configs: Optional[List[Dict]] = None,
+                  seed: int = 0) -> List[Dict]:
+    import numpy as np
+    # Queries are drawn from the corpus itself; ground truth is the exact flat index over the full vectors.
+    # "dims" simulates shortened embeddings, "codec" compressed codes, "rerank" rescoring k*rerank candidates
+    n, dim = vecs.shape
+    if not n:
+        return []
+    rng = np.random.default_rng(seed)
+    pick = rng.choice(n, min(n_queries, n), replace=False)
+    qs = np.ascontiguousarray(vecs[pick], dtype="float32")
+    k = min(k, n)
+    if configs is None:
+        configs = [{"backend": "flat"}]
+        configs += [{"backend": "hnsw", "ef_search": ef} for ef in (16, 32, 64, 128, 256)]
+        configs += [{"backend": "ivf", "nprobe": p} for p in (1, 4, 8, 16, 32, 64)]
+        factor = RERANK_FACTOR or 4
+        configs += [{"backend": "flat", "codec": c, "rerank": r} for c in ("fp16", "sq8", "pq") for r in (0, factor)]
+        configs += [{"backend": "flat", "dims": d, "codec": c, "rerank": r}
+                    for d in (dim // 2, dim // 4) if d >= 64 for c, r in (("flat", 0), ("sq8", factor))]
+
+    exact = build_index(vecs, "flat")
+    _, truth = exact.search(qs, k)
+    built, shortened, seen = {}, {}, set()
+    rows = []
+    for cfg in configs:
+        backend, dims, rr = cfg["backend"], cfg.get("dims") or dim, cfg.get("rerank") or 0
+        codec = fit_codec(cfg.get("codec", "flat"), n)
+        # Codecs the corpus is too small to train fall back (pq -> sq8 -> flat); report each setup once
+        setup = (backend, codec, dims, rr, cfg.get("ef_search"), cfg.get("nprobe"))
+        if setup in seen:
+            continue
+        seen.add(setup)
+        if dims not in shortened:
+            shortened[dims] = vecs if dims == dim else shorten(vecs, dims)
+        sub = shortened[dims]
+        t0 = time.perf_counter()
+        key = (backend, codec, dims)
+        if key not in built:
+            built[key] = build_index(sub, backend, seed=seed, codec=codec)
+            build_s = time.perf_counter() - t0
+        else:
+            build_s = 0.0
+        index = built[key]
+        set_search_params(index, ef_search=cfg.get("ef_search"), nprobe=cfg.get("nprobe"))
+        q = np.ascontiguousarray(sub[pick])
+        t0 = time.perf_counter()
+        _, got = index.search(q, min(k * rr, n) if rr else k)
+        if rr:
+            got = [rerank(sub, q[j], g[g >= 0], k) for j, g in enumerate(got)]
+        elapsed = time.perf_counter() - t0
+        hits = sum(len(set(np.asarray(g)[np.asarray(g) >= 0]) & set(t)) for g, t in zip(got, truth))
+        size = bytes_per_vector(index)
+        rows.append({
+            **cfg,
+            "codec": codec,
+            "k": k,
+            "recall": hits / float(k * len(qs)),
+            "ms_per_query": 1000.0 * elapsed / len(qs),
+            "build_s": build_s,
+            "bytes_per_vector": size,
+            "compression": 4.0 * dim / size,
+        })
+    return rows
+
+def set_search_params(index, ef_search: Optional[int] = None, nprobe: Optional[int] = None):
+    import faiss
+    inner = _inner(index)
+    if isinstance(inner, faiss.IndexHNSW) and ef_search:
+        inner.hnsw.efSearch = int(ef_search)
+    if isinstance(inner, faiss.IndexIVF) and nprobe:
+        inner.nprobe = int(nprobe)
+
+if __name__ == "__main__":
+    from core.rag import resident_vectors
+    vecs = resident_vectors()
+    print(f"{len(vecs)} vectors")
+    for r in recall_report(vecs):
+        params = ", ".join(f"{k}={r[k]}" for k in ("ef_search", "nprobe", "dims", "rerank") if r.get(k))
+        print(f"{r['backend']:5s} {r['codec']:4s} {params:20s} recall@{r['k']}={r['recall']:.3f}  "
+              f"{r['ms_per_query']:.3f} ms/query  {r['bytes_per_vector']:7.0f} B/vector ({r['compression']:.1f}x)  "
+              f"build {r['build_s']:.2f}s")
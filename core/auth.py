@@ -1,9 +1,13 @@
+import uuid
 import streamlit as st
+from core import trace
 
 def require_password():
     if "authed" not in st.session_state:
         st.session_state.authed = False
     if st.session_state.authed:
+        # Every protected page calls this first, so it is where a run gets tagged with its session for tracing
+        trace.bind(session=st.session_state.setdefault("trace_session", uuid.uuid4().hex[:12]))
         return True
 
     st.markdown("### 🔒 This app is password-protected")
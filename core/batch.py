@@ -0,0 +1,211 @@
+"""Headless case-study pipeline: one output folder per agency submission folder.
+
+    python -m core.batch submissions/ --out batch_out --concurrency 4 [--images] [--force]
+
+Each submission folder holds the agency's PDF/DOCX/TXT/MD files, plus optionally
+answers.json ({question: answer}) and topic.txt (retrieval hint). Stage results are
+checkpointed in <out>/<submission>/state.json, so a rerun resumes where it stopped.
+"""
+import os, sys, json, time, argparse, threading, traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List
+
+from core import images, scheduler, trace
+from core.llm import chat, generate_images
+from core.rag import ingest_files, build_context, chunks_for
+from core.analysis import analyze
+from core.utils import build_case_study, parse_bullet_lines, parse_json_object
+from core.prompts import (case_fields_prompt, diagram_prompts_prompt, cover_image_prompt,
+                          diagram_image_prompt, answers_text, CASE_FIELDS)
+from core.export import COVER_KEY, parse_sections, suggest_section_for_prompt, build_docx_from_sections
+
+DOC_EXTS = (".pdf", ".docx", ".txt", ".md")
+STAGES = ["ingest", "analyze", "draft", "visuals", "export"]
+_print_lock = threading.Lock()
+
+def _log(msg: str):
+    with _print_lock:
+        print(time.strftime("%H:%M:%S"), msg, flush=True)
+
+def _write_json(path: str, obj):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+def _read_json(path: str, default):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+def _submission_files(folder: str) -> List[str]:
+    return sorted(os.path.join(folder, n) for n in os.listdir(folder)
+                  if n.lower().endswith(DOC_EXTS) and os.path.isfile(os.path.join(folder, n)))
+
+def run_submission(folder: str, out_root: str, with_images: bool = False, force: bool = False) -> Dict:
+    name = os.path.basename(os.path.normpath(folder))
+    out = os.path.join(out_root, name)
+    os.makedirs(out, exist_ok=True)
+    state_path = os.path.join(out, "state.json")
+    state = {} if force else _read_json(state_path, {})
+    state.setdefault("done", {})
+    state.setdefault("timings", {})
+    state.pop("error", None)
+    state.pop("traceback", None)
+
+    ran, resumed = {}, []   # this run's stage timings vs stages restored from the checkpoint
+
+    trace.bind(session=name)
+    scheduler.demote(scheduler.BACKGROUND)   # officers drafting in the app go first
+
+    def stage(key, fn):
+        if key in state["done"]:
+            resumed.append(key)
+            return state["done"][key]
+        t0 = time.perf_counter()
+        with trace.step(key):
+            result = fn()
+        state["timings"][key] = ran[key] = time.perf_counter() - t0
+        state["done"][key] = result
+        _write_json(state_path, state)   # checkpoint after every stage
+        _log(f"[{name}] {key} done in {state['timings'][key]:.1f}s")
+        return result
+
+    try:
+        def do_ingest():
+            files = []
+            for p in _submission_files(folder):
+                with open(p, "rb") as f:
+                    files.append((os.path.basename(p), f.read()))
+            if not files:
+                raise RuntimeError("no PDF/DOCX/TXT/MD files found")
+            summary = ingest_files(files, source=name)
+            return {"files": [f for f, _ in files], "chunks": summary["chunks"],
+                    "digests": [f["digest"] for f in summary["files"]] + [s["digest"] for s in summary["skipped"]]}
+        ingest = stage("ingest", do_ingest)
+        # By digest, so files already indexed by another submission or upload (and tagged with its source) count too;
+        # checkpoints written before chunks carried digests fall back to the submission's source tag
+        filters = {"digest": set(ingest["digests"])} if "digests" in ingest else {"source": name}
+
+        def do_analyze():
+            result = analyze(chunks_for(filters))
+            with open(os.path.join(out, "questions.md"), "w", encoding="utf-8") as f:
+                f.write(result["questions_text"])
+            return {"questions": result["questions"], "coverage": result["coverage"], "excerpts": result["excerpts"]}
+        stage("analyze", do_analyze)
+
+        def do_draft():
+            answers = _read_json(os.path.join(folder, "answers.json"), {})
+            topic_path = os.path.join(folder, "topic.txt")
+            topic = name
+            if os.path.exists(topic_path):
+                with open(topic_path, encoding="utf-8") as f:
+                    topic = f.read().strip() or name
+            base = build_context(topic, filters=filters)["text"] or "(no context)"
+            raw = chat([{"role": "user", "content": case_fields_prompt(base, answers_text(answers))}])
+            fields = parse_json_object(raw)
+            md = build_case_study(**{k: str(fields.get(k, "")).strip() for k in CASE_FIELDS})
+            with open(os.path.join(out, "case_study.md"), "w", encoding="utf-8") as f:
+                f.write(md)
+            return {"markdown": "case_study.md"}
+        stage("draft", do_draft)
+        with open(os.path.join(out, "case_study.md"), encoding="utf-8") as f:
+            md = f.read()
+
+        prev = state["done"].get("visuals") or {}
+        if with_images and prev.get("failed") and prev.get("retry"):
+            # Images that failed last run are retried on their own (and the document re-exported); the rest are kept
+            for key in ("visuals", "export"):
+                state["done"].pop(key, None)
+
+        def do_visuals():
+            if not with_images:
+                return {"cover": None, "diagrams": {}}
+            if prev.get("retry"):
+                jobs = {k: tuple(v) for k, v in prev["retry"].items()}
+                ids = dict(prev["diagrams"], **({COVER_KEY: prev["cover"]} if prev.get("cover") else {}))
+            else:
+                prompts = parse_bullet_lines(chat([{"role": "user", "content": diagram_prompts_prompt(md)}]))[:3]
+                jobs = {p: (diagram_image_prompt(p), "1024x1024") for p in prompts}
+                jobs[COVER_KEY] = (cover_image_prompt("flat illustration", name.replace("_", " ")), "1536x1024")
+                ids = {}
+            failed = {}
+            for key, img, err in generate_images(jobs):
+                if err is not None:
+                    failed[key] = str(err)
+                else:
+                    ids[key] = images.put(img)
+            return {"cover": ids.pop(COVER_KEY, None), "diagrams": ids, "failed": failed,
+                    "retry": {k: list(jobs[k]) for k in failed}}
+        visuals = stage("visuals", do_visuals)
+
+        def do_export():
+            cover_id, diag_ids = visuals.get("cover"), visuals.get("diagrams", {})
+            placement = {p: suggest_section_for_prompt(p) for p in diag_ids}
+            if cover_id:
+                placement[COVER_KEY] = "Title"
+            buf = build_docx_from_sections(
+                parse_sections(md), placement,
+                images.full(cover_id) if cover_id else None,
+                {p: images.full(i) for p, i in diag_ids.items()},
+            )
+            path = os.path.join(out, "LEAPscribe_Case_Study.docx")
+            with open(path, "wb") as f:
+                f.write(buf.getvalue())
+            return {"docx": os.path.basename(path), "bytes": os.path.getsize(path)}
+        stage("export", do_export)
+        state["status"] = "done"
+    except Exception as e:
+        state["status"] = "failed"
+        state["error"] = f"{type(e).__name__}: {e}"
+        state["traceback"] = traceback.format_exc()
+        _log(f"[{name}] FAILED: {state['error']}")
+    _write_json(state_path, state)
+    return {"submission": name, "status": state["status"], "timings": ran, "resumed": resumed,
+            "error": state.get("error")}
+
+def run_batch(input_dir: str, out_root: str, concurrency: int = 4, with_images: bool = False,
+              force: bool = False) -> Dict:
+    folders = sorted(os.path.join(input_dir, n) for n in os.listdir(input_dir)
+                     if os.path.isdir(os.path.join(input_dir, n)) and not n.startswith("."))
+    os.makedirs(out_root, exist_ok=True)
+    t0 = time.perf_counter()
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futs = [pool.submit(trace.propagate(run_submission), f, out_root, with_images, force) for f in folders]
+        for fut in as_completed(futs):
+            results.append(fut.result())
+    wall = time.perf_counter() - t0
+    stage_totals = {s: sum(r["timings"].get(s, 0.0) for r in results) for s in STAGES}
+    stats = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(time.time() - wall)),
+        "wall_seconds": wall,
+        "concurrency": concurrency,
+        "submissions": len(results),
+        "done": sum(r["status"] == "done" for r in results),
+        "failed": sum(r["status"] == "failed" for r in results),
+        "resumed": sum(bool(r["resumed"]) for r in results),
+        "stage_seconds": stage_totals,
+        "results": sorted(results, key=lambda r: r["submission"]),
+    }
+    _write_json(os.path.join(out_root, "run_stats.json"), stats)
+    with open(os.path.join(out_root, "runs.jsonl"), "a", encoding="utf-8") as f:
+        f.write(json.dumps({k: v for k, v in stats.items() if k != "results"}) + "\n")
+    return stats
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m core.batch", description="Produce case studies for a folder of agency submissions.")
+    ap.add_argument("input_dir", help="directory containing one sub-folder per submission")
+    ap.add_argument("--out", default="batch_out", help="output directory (default: batch_out)")
+    ap.add_argument("--concurrency", type=int, default=4, help="submissions processed in parallel (default: 4)")
+    ap.add_argument("--images", action="store_true", help="also generate a cover and diagrams")
+    ap.add_argument("--force", action="store_true", help="ignore checkpoints and redo every stage")
+    args = ap.parse_args(argv)
+    stats = run_batch(args.input_dir, args.out, args.concurrency, args.images, args.force)
+    _log(f"{stats['done']}/{stats['submissions']} done, {stats['failed']} failed in {stats['wall_seconds']:.1f}s")
+    return 1 if stats["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
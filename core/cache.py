@@ -0,0 +1,208 @@
+import os, json, time, sqlite3, hashlib, threading
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+CACHE_DIR = "data"
+EMBED_CACHE_PATH = os.path.join(CACHE_DIR, "embed_cache.sqlite")
+CHAT_CACHE_PATH = os.path.join(CACHE_DIR, "chat_cache.sqlite")
+
+# SQLite keeps the variable count per statement under 999 on older builds
+_SQL_BATCH = 500
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class EmbeddingCache:
+    """Content-addressed vector cache: sha256(model, dimensions, text) -> float32 blob, LRU-bounded by bytes."""
+
+    def __init__(self, path: str = EMBED_CACHE_PATH, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._bytes = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = _connect(self.path)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS vecs ("
+                " key BLOB PRIMARY KEY, vec BLOB NOT NULL, size INTEGER NOT NULL, atime REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS vecs_atime ON vecs(atime)")
+            self._bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM vecs").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def key(model: str, dimensions: Optional[int], text: str) -> bytes:
+        return hashlib.sha256(f"{model}\0{dimensions or ''}\0{text}".encode("utf-8")).digest()
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, List[float]]:
+        found: Dict[bytes, List[float]] = {}
+        if not keys:
+            return found
+        uniq = list(dict.fromkeys(keys))
+        with self._lock:
+            db = self._db()
+            for i in range(0, len(uniq), _SQL_BATCH):
+                part = uniq[i : i + _SQL_BATCH]
+                marks = ",".join("?" * len(part))
+                for k, blob in db.execute(f"SELECT key, vec FROM vecs WHERE key IN ({marks})", part):
+                    v = array("f")
+                    v.frombytes(blob)
+                    found[bytes(k)] = v.tolist()
+            if found:
+                now = time.time()
+                db.executemany("UPDATE vecs SET atime=? WHERE key=?", [(now, k) for k in found])
+            hit = sum(1 for k in keys if k in found)
+            self.hits += hit
+            self.misses += len(keys) - hit
+        return found
+
+    def put_many(self, items: Iterable[Tuple[bytes, List[float]]]):
+        now = time.time()
+        rows = []
+        for k, vec in items:
+            blob = array("f", vec).tobytes()
+            rows.append((k, blob, len(blob), now))
+        if not rows:
+            return
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN")
+            db.executemany("INSERT OR REPLACE INTO vecs (key, vec, size, atime) VALUES (?,?,?,?)", rows)
+            db.execute("COMMIT")
+            self._bytes += sum(r[2] for r in rows)
+            if self._bytes > self.max_bytes:
+                self._evict(db)
+
+    def _evict(self, db: sqlite3.Connection):
+        # Other processes share the file, so re-count before trimming to 90% of the cap
+        self._bytes = db.execute("SELECT COALESCE(SUM(size), 0) FROM vecs").fetchone()[0]
+        target = int(self.max_bytes * 0.9)
+        while self._bytes > target:
+            rows = db.execute("SELECT key, size FROM vecs ORDER BY atime LIMIT ?", (_SQL_BATCH,)).fetchall()
+            if not rows:
+                break
+            drop, freed = [], 0
+            for k, size in rows:
+                drop.append((k,))
+                freed += size
+                if self._bytes - freed <= target:
+                    break
+            db.executemany("DELETE FROM vecs WHERE key=?", drop)
+            self._bytes -= freed
+            self.evictions += len(drop)
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        with self._lock:
+            db = self._db()
+            entries = db.execute("SELECT COUNT(*) FROM vecs").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "entries": entries,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._db().execute("DELETE FROM vecs")
+            self._bytes = 0
+
+
+class ResponseCache:
+    """Exact-match chat completion cache: sha256(model, canonical messages) -> text, with TTL and LRU entry cap."""
+
+    def __init__(self, path: str = CHAT_CACHE_PATH, ttl_s: float = 24 * 3600, max_entries: int = 2000):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = _connect(self.path)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, model TEXT NOT NULL, body TEXT NOT NULL,"
+                " created REAL NOT NULL, atime REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_atime ON responses(atime)")
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def key(model: str, messages, **params) -> str:
+        # Canonical JSON so key order inside the message dicts does not split entries
+        payload = json.dumps({"model": model, "messages": messages, **params},
+                             sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, ttl_s: Optional[float] = None) -> Optional[str]:
+        ttl = self.ttl_s if ttl_s is None else ttl_s
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT body, created FROM responses WHERE key=?", (key,)).fetchone()
+            if row is not None and ttl > 0 and now - row[1] > ttl:
+                db.execute("DELETE FROM responses WHERE key=?", (key,))
+                self.expired += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            db.execute("UPDATE responses SET atime=? WHERE key=?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, model: str, body: str):
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute("INSERT OR REPLACE INTO responses (key, model, body, created, atime) VALUES (?,?,?,?,?)",
+                       (key, model, body, now, now))
+            n = db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if n > self.max_entries:
+                drop = n - self.max_entries
+                db.execute("DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY atime LIMIT ?)",
+                           (drop,))
+                self.evictions += drop
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        with self._lock:
+            entries = self._db().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl_s,
+            "expired": self.expired,
+            "evictions": self.evictions,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._db().execute("DELETE FROM responses")
@@ -0,0 +1,174 @@
+import re, hashlib
+from core import config
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from core.tokens import encoding_for
+
+CHUNK_TOKENS   = int(config.get("CHUNK_TOKENS", 400))
+CHUNK_OVERLAP  = int(config.get("CHUNK_OVERLAP_TOKENS", 50))
+NEAR_DUP_BITS  = int(config.get("NEAR_DUP_BITS", 3))   # max SimHash Hamming distance treated as duplicate
+
+PAGE_BREAK = "\f"
+_PARA_RE = re.compile(r"\n\s*\n")
+_SENT_RE = re.compile(r"(?<=[.!?])\s+")
+_WORD_RE = re.compile(r"\w+")
+_HEADING_RE = re.compile(r"^(#{1,6}\s+\S|(\d+(\.\d+)*|[IVX]+)[.)]\s+\S)")
+
+Pages = Union[str, Iterable[Tuple[Optional[int], str]]]
+
+
+def _is_heading(block: str) -> bool:
+    line = block.strip()
+    if "\n" in line or len(line) > 90:
+        return False
+    if _HEADING_RE.match(line):
+        return True
+    # Short title-like lines: "Implementation Approach", "BENEFITS"
+    return len(line.split()) <= 8 and not line.endswith((".", ",", ";", ":")) and line[:1].isupper() and (
+        line.isupper() or line.istitle()
+    )
+
+
+def _pages(src: Pages) -> Iterator[Tuple[Optional[int], str]]:
+    if isinstance(src, str):
+        parts = src.split(PAGE_BREAK)
+        paged = len(parts) > 1
+        for i, p in enumerate(parts, start=1):
+            yield (i if paged else None), p
+    else:
+        yield from src
+
+
+def _blocks(pages: Iterable[Tuple[Optional[int], str]]) -> Iterator[Tuple[Optional[int], str, bool]]:
+    # Short lines found on several pages (slide footers, running headers) are dropped from the third page on;
+    # unpaged input (TXT, DOCX) and repeats within one page are left alone
+    pages_with: Dict[str, int] = {}
+    first = True
+    for page_no, text in pages:
+        kept = text.splitlines()
+        if page_no is not None:
+            for key in {line.strip().lower() for line in kept}:
+                if key and len(key) <= 120:
+                    pages_with[key] = pages_with.get(key, 0) + 1
+            kept = [line for line in kept if pages_with.get(line.strip().lower(), 0) < 3]
+        paras = [p.strip() for p in _PARA_RE.split("\n".join(kept)) if p.strip()]
+        for j, para in enumerate(paras):
+            # (page, paragraph, starts_new_page)
+            yield page_no, para, (j == 0 and not first)
+        if paras:
+            first = False
+
+
+class Deduper:
+    """Drops exact (normalised hash) and near-duplicate (64-bit SimHash over word 3-shingles) chunks."""
+
+    def __init__(self, max_bits: int = NEAR_DUP_BITS, parent: Optional["Deduper"] = None):
+        # A parent (e.g. the indexed corpus) is consulted but never written to
+        self.max_bits = max_bits
+        self.parent = parent
+        self.exact = set()
+        self.bands: List[Dict[int, List[int]]] = [{} for _ in range(4)]
+        self.dropped = 0
+
+    @staticmethod
+    def _norm(text: str) -> List[str]:
+        return _WORD_RE.findall(text.lower())
+
+    @staticmethod
+    def simhash(words: List[str]) -> int:
+        shingles = [" ".join(words[i : i + 3]) for i in range(max(1, len(words) - 2))]
+        acc = [0] * 64
+        for sh in shingles:
+            h = int.from_bytes(hashlib.blake2b(sh.encode("utf-8"), digest_size=8).digest(), "big")
+            for b in range(64):
+                acc[b] += 1 if (h >> b) & 1 else -1
+        return sum(1 << b for b in range(64) if acc[b] > 0)
+
+    def _near(self, sh: int) -> bool:
+        # Pigeonhole: within 3 bits, at least one of the four 16-bit bands matches exactly
+        for i, band in enumerate(self.bands):
+            for other in band.get((sh >> (16 * i)) & 0xFFFF, ()):
+                if bin(sh ^ other).count("1") <= self.max_bits:
+                    return True
+        return self.parent is not None and self.parent._near(sh)
+
+    def _seen(self, digest: str) -> bool:
+        return digest in self.exact or (self.parent is not None and self.parent._seen(digest))
+
+    def add(self, sh: int, digest: Optional[str] = None):
+        if digest:
+            self.exact.add(digest)
+        for i, band in enumerate(self.bands):
+            band.setdefault((sh >> (16 * i)) & 0xFFFF, []).append(sh)
+
+    def check(self, text: str) -> Tuple[bool, int, str]:
+        # Returns (is_duplicate, simhash, digest) and records the chunk when it is new
+        words = self._norm(text)
+        digest = hashlib.sha1(" ".join(words).encode("utf-8")).hexdigest()
+        sh = self.simhash(words)
+        if self._seen(digest) or (len(words) >= 8 and self._near(sh)):
+            self.dropped += 1
+            return True, sh, digest
+        self.add(sh, digest)
+        return False, sh, digest
+
+
+def iter_chunks(src: Pages, max_tokens: int = CHUNK_TOKENS, overlap: int = CHUNK_OVERLAP,
+                model: str = "text-embedding-3-small", dedupe: Optional[Deduper] = None) -> Iterator[Dict]:
+    """Yield {"text", "page", "tokens"} chunks sized in model tokens, breaking at headings and pages where possible."""
+    enc = encoding_for(model)
+    min_tokens = max_tokens // 4
+    buf: List[Tuple[str, int, Optional[int]]] = []   # (paragraph, tokens, page)
+    buf_tokens = 0
+
+    def emit(carry: bool, next_n: int = 0):
+        nonlocal buf, buf_tokens
+        text = "\n\n".join(p for p, _, _ in buf).strip()
+        out = None
+        if text:
+            # Labelled with the page its text starts on (the carried overlap included)
+            page = next((pg for _, _, pg in buf if pg is not None), None)
+            out = {"text": text, "page": page, "tokens": buf_tokens}
+            if dedupe is not None:
+                dup, sh, _ = dedupe.check(text)
+                out = None if dup else {**out, "simhash": sh}
+        tail, tail_tokens = [], 0
+        if carry and overlap:
+            for p, n, pg in reversed(buf):
+                if tail_tokens + n > overlap or tail_tokens + n + next_n > max_tokens:
+                    break
+                tail.insert(0, (p, n, pg))
+                tail_tokens += n
+        buf, buf_tokens = tail, tail_tokens
+        return out
+
+    for page_no, para, new_page in _blocks(_pages(src)):
+        toks = enc.encode(para, disallowed_special=())
+        n = len(toks)
+        if buf and ((new_page or _is_heading(para)) and buf_tokens >= min_tokens):
+            c = emit(carry=False)
+            if c: yield c
+        if buf and buf_tokens + n > max_tokens:
+            c = emit(carry=True, next_n=n)
+            if c: yield c
+        if n <= max_tokens:
+            buf.append((para, n, page_no)); buf_tokens += n
+            continue
+        # Oversized paragraph: sentence-pack, then hard token windows as a last resort
+        pieces: List[Tuple[str, int]] = []
+        for sent in _SENT_RE.split(para):
+            st_toks = enc.encode(sent, disallowed_special=())
+            if len(st_toks) <= max_tokens:
+                pieces.append((sent, len(st_toks)))
+            else:
+                step = max(1, max_tokens - overlap)
+                for i in range(0, len(st_toks), step):
+                    w = st_toks[i : i + max_tokens]
+                    pieces.append((enc.decode(w), len(w)))
+        for piece, m in pieces:
+            if buf and buf_tokens + m > max_tokens:
+                c = emit(carry=True, next_n=m)
+                if c: yield c
+            buf.append((piece, m, page_no)); buf_tokens += m
+    if buf:
+        c = emit(carry=False)
+        if c: yield c
@@ -0,0 +1,60 @@
+import os, sys
+from typing import Any, Callable, Dict, Optional
+
+# Lookup order: configure(...) overrides -> environment -> Streamlit secrets -> default.
+# Streamlit itself is only consulted when a page has already imported it; scripts and the batch CLI
+# read .streamlit/secrets.toml directly, so core never has to import streamlit.
+
+_overrides: Dict[str, Any] = {}
+_file_secrets: Optional[Dict[str, Any]] = None
+
+def configure(**settings):
+    # Explicit settings win over env and secrets; call before importing the modules that read them
+    _overrides.update(settings)
+
+def _secrets_file() -> Dict[str, Any]:
+    global _file_secrets
+    if _file_secrets is None:
+        _file_secrets = {}
+        try:
+            import tomllib as _toml
+            def load(p):
+                with open(p, "rb") as f:
+                    return _toml.load(f)
+        except ImportError:   # Python < 3.11
+            try:
+                import toml as _toml
+                load = lambda p: _toml.load(p)
+            except ImportError:
+                return _file_secrets
+        # Same locations Streamlit searches; the project file wins over the global one
+        for path in (os.path.expanduser("~/.streamlit/secrets.toml"), os.path.join(os.getcwd(), ".streamlit", "secrets.toml")):
+            if os.path.exists(path):
+                try:
+                    _file_secrets.update(load(path))
+                except Exception:
+                    pass
+    return _file_secrets
+
+def _streamlit_secret(name: str):
+    st = sys.modules.get("streamlit")
+    if st is None:
+        return _secrets_file().get(name)
+    try:
+        return st.secrets.get(name)
+    except Exception:
+        # No secrets.toml configured
+        return _secrets_file().get(name)
+
+def get(name: str, default: Any = None, cast: Optional[Callable[[Any], Any]] = None) -> Any:
+    if name in _overrides:
+        value = _overrides[name]
+    elif os.environ.get(name) not in (None, ""):
+        value = os.environ[name]
+    else:
+        value = _streamlit_secret(name)
+        if value is None:
+            value = default
+    if cast is not None and value is not None:
+        return cast(value)
+    return value
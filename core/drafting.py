@@ -0,0 +1,56 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional, Tuple
+from core import config, trace
+from core.llm import chat, CHAT_MODEL
+from core.rag import build_context
+from core.utils import build_case_study
+from core.prompts import CASE_FIELDS, SECTION_SPECS, section_prompt, answers_text
+
+# Every section is its own chat call with its own retrieval, so a draft takes as long as its slowest section
+DRAFT_CONCURRENCY      = int(config.get("DRAFT_CONCURRENCY", 8))
+SECTION_CONTEXT_TOKENS = int(config.get("SECTION_CONTEXT_TOKENS", 1200))
+
+def section_answers(field: str, answers: Dict[str, str]) -> Dict[str, str]:
+    # Answers whose question mentions the section's keywords; sections with no match see them all
+    answered = {q: a for q, a in answers.items() if a and a.strip()}
+    keywords = SECTION_SPECS[field]["keywords"]
+    picked = {q: a for q, a in answered.items() if any(k in q.lower() for k in keywords)}
+    return picked or answered
+
+def draft_section(field: str, topic: str, answers: Dict[str, str], fresh: bool = False,
+                  filters: Dict = None, model: str = CHAT_MODEL) -> str:
+    with trace.span("section", field, fresh=fresh) as t:
+        ctx = build_context(f"{topic} {SECTION_SPECS[field]['hint']}", budget=SECTION_CONTEXT_TOKENS, filters=filters)
+        prompt = section_prompt(field, ctx["text"] or "(no context)", answers_text(section_answers(field, answers)))
+        text = chat([{"role": "user", "content": prompt}], model=model, cache=not fresh).strip()
+        if field == "title":
+            text = text.splitlines()[0].strip("# *\"") if text else ""
+        t["context_tokens"] = ctx["tokens"]
+    return text
+
+def draft_sections(topic: str, answers: Dict[str, str], fields: Optional[List[str]] = None, fresh: bool = False,
+                   filters: Dict = None, model: str = CHAT_MODEL
+                   ) -> Iterator[Tuple[str, Optional[str], Optional[Exception], float]]:
+    # Yields (field, markdown, None, seconds) or (field, None, error, seconds) in completion order;
+    # one failed section never cancels the others
+    fields = list(fields or CASE_FIELDS)
+    if not fields:
+        return
+
+    def run(field):
+        t0 = time.perf_counter()
+        try:
+            return draft_section(field, topic, answers, fresh, filters, model), None, time.perf_counter() - t0
+        except Exception as e:
+            return None, e, time.perf_counter() - t0
+
+    with ThreadPoolExecutor(max_workers=max(1, min(DRAFT_CONCURRENCY, len(fields)))) as pool:
+        futs = {pool.submit(trace.propagate(run), f): f for f in fields}
+        for fut in as_completed(futs):
+            text, err, seconds = fut.result()
+            yield futs[fut], text, err, seconds
+
+def assemble(sections: Dict[str, str]) -> str:
+    # CASE_TEMPLATE order from core.utils; missing sections render empty
+    return build_case_study(**{k: sections.get(k) or "" for k in CASE_FIELDS})
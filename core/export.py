@@ -0,0 +1,286 @@
+import re, html, json, hashlib, threading, zipfile
+from collections import OrderedDict
+from functools import lru_cache
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+from core import config
+from core import images
+
+EXPORT_DPI     = int(config.get("EXPORT_DPI", 150))
+IMAGE_WIDTH_IN = 5.5
+JPEG_QUALITY   = int(config.get("EXPORT_JPEG_QUALITY", 85))
+RENDER_CACHE_SIZE = int(config.get("EXPORT_CACHE_SIZE", 32))
+
+# ---- Parse case study into sections (simple markdown parser) ----
+# We expect the generated draft to use these H2 headings:
+# ## Executive Summary, ## Problem / Need, ## Implementation Approach, ## Benefits & Impact, ## Key Learning Points, ## Point of Contact, ## Suggested Visuals / Diagrams
+SECTION_ORDER = [
+    "Title",
+    "Executive Summary",
+    "Problem / Need",
+    "Implementation Approach",
+    "Benefits & Impact",
+    "Key Learning Points",
+    "Point of Contact",
+]
+
+COVER_KEY = "__COVER__"
+
+@lru_cache(maxsize=64)
+def _parse(md: str) -> Tuple[Tuple[str, Tuple[str, ...]], ...]:
+    sections = {"Title": []}
+    current = "Title"
+    for raw_line in md.splitlines():
+        line = raw_line.strip()
+
+        # H1 -> Title content
+        if line.startswith("# "):
+            sections["Title"] = [line[2:].strip()]
+            current = "Title"
+            continue
+
+        # H2 -> start new section
+        if line.startswith("## "):
+            heading = line[3:].strip()
+            # normalize to known section names if possible
+            normalized = None
+            for std in SECTION_ORDER[1:]:
+                if std.lower().split()[0] in heading.lower():
+                    normalized = std
+                    break
+            heading_key = normalized or heading
+            sections.setdefault(heading_key, [])
+            current = heading_key
+            continue
+
+        sections.setdefault(current, []).append(raw_line)  # preserve raw text for styling
+    # Ensure all expected sections exist (even if empty)
+    for sec in SECTION_ORDER:
+        sections.setdefault(sec, [])
+    # Frozen so the memoized tree cannot be mutated by callers
+    return tuple((k, tuple(v)) for k, v in sections.items())
+
+def parse_sections(md: str) -> Dict[str, List[str]]:
+    return {k: list(v) for k, v in _parse(md)}
+
+# ---- Auto-suggest placements for diagram images (heuristics) ----
+def suggest_section_for_prompt(prompt: str) -> str:
+    p = prompt.lower()
+    if any(k in p for k in ["exec", "overview", "summary"]):
+        return "Executive Summary"
+    if any(k in p for k in ["problem", "need", "challenge", "why"]):
+        return "Problem / Need"
+    if any(k in p for k in ["implement", "workflow", "process", "timeline", "approach"]):
+        return "Implementation Approach"
+    if any(k in p for k in ["benefit", "impact", "kpi", "metric", "outcome"]):
+        return "Benefits & Impact"
+    if any(k in p for k in ["learning", "lesson", "retrospective"]):
+        return "Key Learning Points"
+    if any(k in p for k in ["contact", "poc"]):
+        return "Point of Contact"
+    if any(k in p for k in ["diagram", "visual"]):
+        return "Suggested Visuals / Diagrams"
+    # default: Implementation (most diagrams are flows)
+    return "Implementation Approach"
+
+# ---- Print-sized images ----
+def print_image(data: bytes, width_in: float = IMAGE_WIDTH_IN, dpi: int = EXPORT_DPI) -> Tuple[bytes, str]:
+    # Downsample to the printed width at the target DPI; JPEG unless the image needs its alpha channel
+    from PIL import Image
+    px = int(width_in * dpi)
+    with Image.open(BytesIO(data)) as im:
+        if im.width > px:
+            im = im.resize((px, round(im.height * px / im.width)), Image.LANCZOS)
+        has_alpha = im.mode in ("RGBA", "LA") and im.getchannel("A").getextrema()[0] < 255
+        buf = BytesIO()
+        if has_alpha:
+            im.save(buf, "PNG", optimize=True)
+            return buf.getvalue(), "png"
+        im.convert("RGB").save(buf, "JPEG", quality=JPEG_QUALITY, optimize=True, dpi=(dpi, dpi))
+        return buf.getvalue(), "jpg"
+
+@lru_cache(maxsize=64)
+def _print_image_by_id(image_id: str, dpi: int) -> Tuple[bytes, str]:
+    return print_image(images.full(image_id), dpi=dpi)
+
+def _ordered_keys(sections: dict) -> List[str]:
+    # Our preferred order, then any extra sections the model may have added
+    return [k for k in SECTION_ORDER if k != "Title"] + [k for k in sections.keys() if k not in SECTION_ORDER]
+
+def _title(sections: dict) -> str:
+    title_text = "Case Study"
+    if sections.get("Title"):
+        # First non-empty line used as title if H1 was present
+        t = sections["Title"][0].strip("# ").strip()
+        if t:
+            title_text = t
+    return title_text
+
+def _layout(sections: dict, placement: dict, cover, diags: dict):
+    # Shared by every output format: [(section_key, body_lines, [(caption, image)])], extras
+    layout = [("Title", [], [("Cover Image", cover)] if cover is not None and placement.get(COVER_KEY) == "Title" else [])]
+    rendered = set(["Title"])
+    for key in _ordered_keys(sections):
+        if key in rendered:
+            continue
+        rendered.add(key)
+        imgs = []
+        if cover is not None and placement.get(COVER_KEY) == key and key != "Title":
+            imgs.append(("Cover Image", cover))
+        for prompt, img in (diags or {}).items():
+            if placement.get(prompt) == key:
+                imgs.append((prompt, img))
+        layout.append((key, sections.get(key, []), imgs))
+    # If any images still unmapped (unlikely), they go at the end
+    extras = [(prompt, img) for prompt, img in (diags or {}).items() if placement.get(prompt) not in sections]
+    return layout, extras
+
+# ---- Build DOCX according to placements ----
+def build_docx_from_sections(sections: dict, placement: dict, cover_img: Optional[bytes], diag_imgs: dict,
+                             dpi: Optional[int] = EXPORT_DPI):
+    from docx import Document
+    from docx.shared import Inches
+    doc = Document()
+
+    # Helper: insert an image with sane width, downsampled to print resolution unless dpi is None
+    def add_img(img_bytes: bytes):
+        data = print_image(img_bytes, dpi=dpi)[0] if dpi else img_bytes
+        doc.add_picture(BytesIO(data), width=Inches(IMAGE_WIDTH_IN))
+        doc.add_paragraph()
+
+    doc.add_heading(_title(sections), level=1)
+    layout, extras = _layout(sections, placement, cover_img, diag_imgs)
+    for key, body_lines, imgs in layout:
+        if key != "Title":
+            # Heading
+            doc.add_heading(key, level=2)
+            # naive markdown-ish rendering
+            for raw in body_lines:
+                line = raw.rstrip()
+                if not line:
+                    doc.add_paragraph()
+                elif line.startswith("- ") or line.startswith("* "):
+                    doc.add_paragraph(line[2:], style="List Bullet")
+                elif line.startswith("**") and line.endswith("**"):
+                    doc.add_paragraph(line.strip("*"), style="Intense Quote")
+                else:
+                    doc.add_paragraph(line)
+        for _, img in imgs:
+            add_img(img)
+
+    for prompt, img in extras:
+        doc.add_page_break()
+        doc.add_heading("Additional Visual", level=2)
+        doc.add_paragraph(prompt)
+        add_img(img)
+
+    buf = BytesIO()
+    doc.save(buf)
+    buf.seek(0)
+    return buf
+
+# ---- Markdown / HTML ----
+_BOLD_RE = re.compile(r"\*\*(.+?)\*\*")
+
+def _inline_html(text: str) -> str:
+    return _BOLD_RE.sub(r"<strong>\1</strong>", html.escape(text))
+
+def render_markdown(sections: dict, placement: dict, cover_ref: Optional[str], diag_refs: dict) -> str:
+    layout, extras = _layout(sections, placement, cover_ref, diag_refs)
+    out = [f"# {_title(sections)}", ""]
+    for key, body_lines, imgs in layout:
+        if key != "Title":
+            out += [f"## {key}", *[l.rstrip() for l in body_lines], ""]
+        out += [f"![{cap}]({ref})\n" for cap, ref in imgs]
+    for prompt, ref in extras:
+        out += ["## Additional Visual", prompt, "", f"![{prompt}]({ref})", ""]
+    return "\n".join(out).rstrip() + "\n"
+
+def render_html(sections: dict, placement: dict, cover_ref: Optional[str], diag_refs: dict) -> str:
+    layout, extras = _layout(sections, placement, cover_ref, diag_refs)
+    title = html.escape(_title(sections))
+    out = [f"<!doctype html><html><head><meta charset='utf-8'><title>{title}</title>",
+           "<style>body{font-family:sans-serif;max-width:48em;margin:2em auto;line-height:1.5}"
+           "img{max-width:100%}blockquote{border-left:4px solid #88a;margin:0;padding-left:1em}</style>",
+           f"</head><body><h1>{title}</h1>"]
+
+    def fig(cap, ref):
+        return f"<figure><img src='{html.escape(ref)}' alt='{html.escape(cap)}'><figcaption>{html.escape(cap)}</figcaption></figure>"
+
+    for key, body_lines, imgs in layout:
+        if key != "Title":
+            out.append(f"<h2>{html.escape(key)}</h2>")
+            in_list = False
+            for raw in body_lines:
+                line = raw.rstrip()
+                is_item = line.startswith("- ") or line.startswith("* ")
+                if in_list and not is_item:
+                    out.append("</ul>")
+                    in_list = False
+                if is_item:
+                    if not in_list:
+                        out.append("<ul>")
+                        in_list = True
+                    out.append(f"<li>{_inline_html(line[2:])}</li>")
+                elif line.startswith("**") and line.endswith("**"):
+                    out.append(f"<blockquote>{html.escape(line.strip('*'))}</blockquote>")
+                elif line:
+                    out.append(f"<p>{_inline_html(line)}</p>")
+            if in_list:
+                out.append("</ul>")
+        out += [fig(cap, ref) for cap, ref in imgs]
+    for prompt, ref in extras:
+        out += ["<h2>Additional Visual</h2>", f"<p>{html.escape(prompt)}</p>", fig(prompt, ref)]
+    out.append("</body></html>")
+    return "\n".join(out)
+
+# ---- Memoized exports keyed by (markdown, placements, image ids) ----
+_rendered: "OrderedDict[str, bytes]" = OrderedDict()   # shared by every session
+_rendered_lock = threading.Lock()
+
+def export_key(md: str, placement: dict, cover_id: Optional[str], diag_ids: dict, fmt: str) -> str:
+    payload = json.dumps({"md": md, "placement": placement, "cover": cover_id, "diagrams": diag_ids,
+                          "fmt": fmt, "dpi": EXPORT_DPI}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _memo(key: str, build) -> bytes:
+    with _rendered_lock:
+        data = _rendered.get(key)
+        if data is not None:
+            _rendered.move_to_end(key)
+            return data
+    data = build()   # outside the lock: one session's export never waits on another's
+    with _rendered_lock:
+        _rendered[key] = data
+        while len(_rendered) > RENDER_CACHE_SIZE:
+            _rendered.popitem(last=False)
+    return data
+
+def export_docx(md: str, placement: dict, cover_id: Optional[str], diag_ids: dict) -> bytes:
+    def build():
+        sections = parse_sections(md)
+        cover = _print_image_by_id(cover_id, EXPORT_DPI)[0] if cover_id else None
+        diags = {p: _print_image_by_id(i, EXPORT_DPI)[0] for p, i in diag_ids.items()}
+        # Images are already print-sized
+        return build_docx_from_sections(sections, placement, cover, diags, dpi=None).getvalue()
+    return _memo(export_key(md, placement, cover_id, diag_ids, "docx"), build)
+
+def export_bundle(md: str, placement: dict, cover_id: Optional[str], diag_ids: dict) -> bytes:
+    # Zip with case_study.md, case_study.html and the print-sized images they reference
+    def build():
+        sections = parse_sections(md)
+        refs, files = {}, {}
+        for key, image_id in ([(COVER_KEY, cover_id)] if cover_id else []) + list(diag_ids.items()):
+            data, ext = _print_image_by_id(image_id, EXPORT_DPI)
+            name = f"images/{image_id}.{ext}"
+            refs[key] = name
+            files[name] = data
+        cover_ref = refs.pop(COVER_KEY, None)
+        buf = BytesIO()
+        with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
+            z.writestr("case_study.md", render_markdown(sections, placement, cover_ref, refs))
+            z.writestr("case_study.html", render_html(sections, placement, cover_ref, refs))
+            for name, data in files.items():
+                z.writestr(name, data, compress_type=zipfile.ZIP_STORED)   # already compressed
+        return buf.getvalue()
+    return _memo(export_key(md, placement, cover_id, diag_ids, "bundle"), build)
@@ -0,0 +1,156 @@
+import os, time, threading
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import Dict, Iterator, List, Optional, Tuple
+from core import config
+
+EXTRACT_WORKERS  = int(config.get("EXTRACT_WORKERS", max(1, min(4, (os.cpu_count() or 2) - 1))))
+PARALLEL_MIN_PAGES = int(config.get("EXTRACT_PARALLEL_MIN_PAGES", 24))
+PAGES_PER_TASK   = int(config.get("EXTRACT_PAGES_PER_TASK", 16))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: Streamlit runs many threads, which fork() does not copy safely
+            _pool = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS, mp_context=mp.get_context("spawn"))
+        return _pool
+
+def _drop_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def new_report(filename: str) -> Dict:
+    return {"filename": filename, "pages": 0, "chars": 0, "seconds": 0.0, "errors": [], "parallel": False}
+
+def _open_pdf(file_bytes: bytes):
+    from PyPDF2 import PdfReader
+    reader = PdfReader(BytesIO(file_bytes))
+    if reader.is_encrypted:
+        try: reader.decrypt("")
+        except Exception: pass
+    return reader
+
+def _pdf_range(file_bytes: bytes, start: int, end: int) -> List[Tuple[int, str, Optional[str]]]:
+    # Runs in a worker process: (page_no, text, error)
+    reader = _open_pdf(file_bytes)
+    out = []
+    for i in range(start, end):
+        try:
+            out.append((i + 1, reader.pages[i].extract_text() or "", None))
+        except Exception as e:
+            out.append((i + 1, "", f"page {i + 1}: {type(e).__name__}: {e}"))
+    return out
+
+def _iter_pdf(file_bytes: bytes, report: Dict) -> Iterator[Tuple[Optional[int], str]]:
+    reader = _open_pdf(file_bytes)
+    n = len(reader.pages)
+    report["pages"] = n
+    ranges = [(s, min(s + PAGES_PER_TASK, n)) for s in range(0, n, PAGES_PER_TASK)]
+    if EXTRACT_WORKERS > 1 and n >= PARALLEL_MIN_PAGES:
+        try:
+            futs = [_get_pool().submit(_pdf_range, file_bytes, s, e) for s, e in ranges]
+            report["parallel"] = True
+        except (BrokenProcessPool, RuntimeError, OSError) as e:
+            _drop_pool()
+            report["errors"].append(f"process pool unavailable, extracting in-process: {e}")
+            futs = None
+        if futs is not None:
+            # Ranges are consumed in submission order, so pages stream out in document order
+            for (s, e), fut in zip(ranges, futs):
+                try:
+                    rows = fut.result()
+                except BrokenProcessPool as err:
+                    _drop_pool()
+                    report["errors"].append(f"worker crashed on pages {s + 1}-{e}, retrying in-process: {err}")
+                    rows = _pdf_range(file_bytes, s, e)
+                for page_no, text, err in rows:
+                    if err:
+                        report["errors"].append(err)
+                    yield page_no, text
+            return
+    for i, page in enumerate(reader.pages):
+        try:
+            text = page.extract_text() or ""
+        except Exception as e:
+            report["errors"].append(f"page {i + 1}: {type(e).__name__}: {e}")
+            text = ""
+        yield i + 1, text
+
+def _docx_blocks(doc) -> Iterator[str]:
+    # Body paragraphs and tables in document order (doc.paragraphs skips tables)
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+    for el in doc.element.body.iterchildren():
+        tag = el.tag.rsplit("}", 1)[-1]
+        if tag == "p":
+            p = Paragraph(el, doc)
+            if not p.text.strip():
+                continue
+            style = (p.style.name if p.style is not None else "") or ""
+            if style.startswith("Heading") or style == "Title":
+                yield "# " + p.text.strip()
+            else:
+                yield p.text
+        elif tag == "tbl":
+            rows = []
+            for row in Table(el, doc).rows:
+                cells = []
+                for c in row.cells:
+                    t = " ".join(c.text.split())
+                    # Merged cells repeat across the span
+                    if not cells or cells[-1] != t:
+                        cells.append(t)
+                if any(cells):
+                    rows.append(" | ".join(cells))
+            if rows:
+                yield "\n".join(rows)
+
+def _iter_docx(file_bytes: bytes, report: Dict) -> Iterator[Tuple[Optional[int], str]]:
+    from docx import Document
+    doc = Document(BytesIO(file_bytes))
+    section: List[str] = []
+    for block in _docx_blocks(doc):
+        # One streamed section per top-level heading
+        if block.startswith("# ") and section:
+            report["pages"] += 1
+            yield None, "\n\n".join(section)
+            section = []
+        section.append(block)
+    if section:
+        report["pages"] += 1
+        yield None, "\n\n".join(section)
+
+def iter_pages(file_bytes: bytes, filename: str, report: Optional[Dict] = None) -> Iterator[Tuple[Optional[int], str]]:
+    """Stream (page_no, text) for PDFs, (None, section_text) for DOCX/TXT; timings and failures go to report."""
+    report = report if report is not None else new_report(filename)
+    name = filename.lower()
+    if name.endswith(".pdf"):
+        gen = _iter_pdf(file_bytes, report)
+    elif name.endswith(".docx"):
+        gen = _iter_docx(file_bytes, report)
+    else:
+        report["pages"] = 1
+        gen = iter([(None, file_bytes.decode("utf-8-sig", errors="ignore"))])
+    while True:
+        # Only time spent producing pages counts, not the consumer's work between pages
+        t0 = time.perf_counter()
+        try:
+            page_no, text = next(gen)
+        except StopIteration:
+            break
+        except Exception as e:
+            report["errors"].append(f"{type(e).__name__}: {e}")
+            break
+        finally:
+            report["seconds"] += time.perf_counter() - t0
+        report["chars"] += len(text)
+        yield page_no, text
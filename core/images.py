@@ -0,0 +1,125 @@
+import os, hashlib, threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import Callable, Optional
+from core import config
+
+IMAGE_DIR        = os.path.join("data", "images")
+THUMB_PX         = int(config.get("IMAGE_THUMB_PX", 384))
+PREVIEW_PX       = int(config.get("IMAGE_PREVIEW_PX", 1024))
+PREVIEW_QUALITY  = int(config.get("IMAGE_PREVIEW_QUALITY", 80))
+STORE_MAX_MB     = int(config.get("IMAGE_STORE_MB", 1024))
+SESSION_CACHE_MB = int(config.get("IMAGE_SESSION_CACHE_MB", 16))
+
+_trim_lock = threading.Lock()
+
+def _path(image_id: str, variant: str = "png") -> str:
+    return os.path.join(IMAGE_DIR, f"{image_id}.{variant}")
+
+def _write_atomic(path: str, data: bytes):
+    tmp = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def put(data: bytes) -> str:
+    """Store full-resolution image bytes once; returns the content id kept in session state."""
+    image_id = hashlib.sha256(data).hexdigest()[:32]
+    path = _path(image_id)
+    if not os.path.exists(path):
+        os.makedirs(IMAGE_DIR, exist_ok=True)
+        _write_atomic(path, data)
+        _trim()
+    return image_id
+
+def exists(image_id: Optional[str]) -> bool:
+    return bool(image_id) and os.path.exists(_path(image_id))
+
+def full(image_id: str) -> bytes:
+    path = _path(image_id)
+    with open(path, "rb") as f:
+        data = f.read()
+    os.utime(path)   # LRU clock for _trim
+    return data
+
+def _variant(image_id: str, px: int, quality: int) -> bytes:
+    path = _path(image_id, f"{px}.webp")
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            return f.read()
+    from PIL import Image
+    with Image.open(BytesIO(full(image_id))) as im:
+        im.thumbnail((px, px))
+        if im.mode not in ("RGB", "RGBA"):
+            im = im.convert("RGBA")
+        buf = BytesIO()
+        im.save(buf, "WEBP", quality=quality, method=4)
+    data = buf.getvalue()
+    _write_atomic(path, data)
+    return data
+
+def thumbnail(image_id: str) -> bytes:
+    return _variant(image_id, THUMB_PX, PREVIEW_QUALITY)
+
+def preview(image_id: str) -> bytes:
+    return _variant(image_id, PREVIEW_PX, PREVIEW_QUALITY)
+
+def _trim():
+    # Disk store is bounded too: drop least-recently-read originals (and their variants) past the cap
+    with _trim_lock:
+        entries, total = [], 0
+        for name in os.listdir(IMAGE_DIR):
+            p = os.path.join(IMAGE_DIR, name)
+            try:
+                st_ = os.stat(p)
+            except FileNotFoundError:
+                continue
+            total += st_.st_size
+            if name.endswith(".png"):
+                entries.append((st_.st_mtime, name[:-4]))
+        cap = STORE_MAX_MB * 1024 * 1024
+        if total <= cap:
+            return
+        for _, image_id in sorted(entries):
+            for name in [n for n in os.listdir(IMAGE_DIR) if n.startswith(image_id + ".")]:
+                p = os.path.join(IMAGE_DIR, name)
+                try:
+                    total -= os.path.getsize(p)
+                    os.remove(p)
+                except FileNotFoundError:
+                    pass
+            if total <= cap * 0.9:
+                break
+
+
+class SessionCache:
+    """Per-session LRU of image bytes, bounded by SESSION_CACHE_MB; misses fall back to the disk store."""
+
+    def __init__(self, max_bytes: int = SESSION_CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._bytes = 0
+
+    def get(self, image_id: str, kind: str = "thumb") -> bytes:
+        key = (image_id, kind)
+        if key in self._items:
+            self._items.move_to_end(key)
+            return self._items[key]
+        loader: Callable[[str], bytes] = {"thumb": thumbnail, "preview": preview, "full": full}[kind]
+        data = loader(image_id)
+        self._items[key] = data
+        self._bytes += len(data)
+        while self._bytes > self.max_bytes and len(self._items) > 1:
+            _, old = self._items.popitem(last=False)
+            self._bytes -= len(old)
+        return data
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+
+def session_cache(state) -> SessionCache:
+    if not isinstance(state.get("_image_cache"), SessionCache):
+        state["_image_cache"] = SessionCache()
+    return state["_image_cache"]
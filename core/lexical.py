@@ -0,0 +1,89 @@
+import re, math
+from array import array
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Okapi BM25 over chunk texts, kept in memory next to the FAISS index and fed the same rows.
+# Postings are compact int arrays (doc ids ascending, term frequencies) so appends stay cheap.
+
+K1 = 1.2
+B = 0.75
+
+# Figures like "1.2", "2,000" and "2023" stay single tokens: officers search for them verbatim
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.,][0-9]+)*")
+_STOP = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the this to was were will with"
+    .split()
+)
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOP]
+
+
+class BM25Index:
+    """Incremental BM25; doc ids are dense row numbers assigned in add() order (None adds a deleted row)."""
+
+    def __init__(self, k1: float = K1, b: float = B):
+        self.k1, self.b = k1, b
+        self._ids: Dict[str, array] = {}
+        self._tfs: Dict[str, array] = {}
+        self._lens = array("i")
+        self._total = 0
+        self._holes = 0
+
+    def __len__(self) -> int:
+        return len(self._lens)
+
+    def add(self, texts: Iterable[str]):
+        for text in texts:
+            doc = len(self._lens)
+            if text is None:
+                # Keeps later ids aligned with rows; left out of the corpus statistics
+                self._lens.append(0)
+                self._holes += 1
+                continue
+            counts: Dict[str, int] = {}
+            toks = tokenize(text)
+            for t in toks:
+                counts[t] = counts.get(t, 0) + 1
+            for t, c in counts.items():
+                if t not in self._ids:
+                    self._ids[t], self._tfs[t] = array("i"), array("i")
+                self._ids[t].append(doc)
+                self._tfs[t].append(c)
+            self._lens.append(len(toks))
+            self._total += len(toks)
+
+    def search(self, q: str, k: int, allow: Optional[Callable[[int], bool]] = None) -> List[Tuple[int, float]]:
+        # -> [(doc id, score)] best-first; allow() filters ids before the top-k cut
+        import numpy as np
+        n = len(self._lens)
+        live = n - self._holes
+        terms = [t for t in set(tokenize(q)) if t in self._ids]
+        if not live or not terms:
+            return []
+        lens = np.frombuffer(self._lens, dtype=np.int32).astype("float32")
+        norm = self.k1 * (1.0 - self.b + self.b * lens / max(self._total / live, 1e-9))
+        scores = np.zeros(n, dtype="float32")
+        for t in terms:
+            ids = np.frombuffer(self._ids[t], dtype=np.int32)
+            tf = np.frombuffer(self._tfs[t], dtype=np.int32).astype("float32")
+            idf = math.log(1.0 + (live - len(ids) + 0.5) / (len(ids) + 0.5))
+            scores[ids] += idf * tf * (self.k1 + 1.0) / (tf + norm[ids])
+        hits = np.flatnonzero(scores)
+        order = hits[np.argsort(-scores[hits], kind="stable")]
+        out = []
+        for i in order:
+            if allow is None or allow(int(i)):
+                out.append((int(i), float(scores[i])))
+                if len(out) >= k:
+                    break
+        return out
+
+
+def rrf(rankings: List[List[int]], k: int, c: int = 60) -> List[int]:
+    # Reciprocal rank fusion: sum of 1/(c + rank) across the input rankings
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for r, i in enumerate(ranking):
+            fused[i] = fused.get(i, 0.0) + 1.0 / (c + r + 1)
+    return sorted(fused, key=lambda i: -fused[i])[:k]
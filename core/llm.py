@@ -1,67 +1,326 @@
-import os, time, base64
-from typing import List, Union
-import streamlit as st
-from openai import OpenAI, OpenAIError
-try:
-    from openai import APIStatusError
-except Exception:
-    APIStatusError = Exception
-
-_API_KEY = os.getenv("OPENAI_API_KEY") or st.secrets.get("OPENAI_API_KEY")
-if not _API_KEY:
-    raise RuntimeError("OPENAI_API_KEY is missing. Add it in Streamlit → Settings → Secrets.")
-
-CHAT_MODEL = st.secrets.get("CHAT_MODEL", "gpt-4o-mini")
-EMBED_MODEL = st.secrets.get("EMBEDDING_MODEL", "text-embedding-3-small")
-IMAGE_MODEL = st.secrets.get("IMAGE_MODEL", "gpt-image-1")
-
-client = OpenAI(api_key=_API_KEY)
-
-def chat(messages, model: str = CHAT_MODEL):
-    try:
-        resp = client.chat.completions.create(model=model, messages=messages)
-        return resp.choices[0].message.content
-    except APIStatusError as e:
+import sys, time, random, threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+from core import config, scheduler, trace
+from core.cache import EmbeddingCache, ResponseCache
+from core.tokens import encoding_for
+
+CHAT_MODEL = config.get("CHAT_MODEL", "gpt-4o-mini")
+EMBED_MODEL = config.get("EMBEDDING_MODEL", "text-embedding-3-small")
+IMAGE_MODEL = config.get("IMAGE_MODEL", "gpt-image-1")
+
+EMBED_BATCH_TOKENS = int(config.get("EMBED_BATCH_TOKENS", 32000))
+EMBED_BATCH_ITEMS = int(config.get("EMBED_BATCH_ITEMS", 512))
+EMBED_CONCURRENCY = int(config.get("EMBED_CONCURRENCY", 4))
+EMBED_MAX_RETRIES = int(config.get("EMBED_MAX_RETRIES", 6))
+EMBED_MAX_INPUT_TOKENS = 8191
+IMAGE_CONCURRENCY = int(config.get("IMAGE_CONCURRENCY", 3))
+IMAGE_MAX_RETRIES = int(config.get("IMAGE_MAX_RETRIES", 2))
+CHAT_MAX_RETRIES = int(config.get("CHAT_MAX_RETRIES", 4))
+CHAT_OUTPUT_TOKENS = int(config.get("CHAT_OUTPUT_TOKENS", 1000))   # reserved against TPM until usage comes back
+
+embed_cache = EmbeddingCache(max_bytes=int(config.get("EMBED_CACHE_MB", 256)) * 1024 * 1024)
+chat_cache = ResponseCache(ttl_s=float(config.get("CHAT_CACHE_TTL_S", 24 * 3600)),
+                           max_entries=int(config.get("CHAT_CACHE_MAX_ENTRIES", 2000)))
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    # Built on first use so importing core (or a page that never calls the API) skips openai entirely
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                api_key = config.get("OPENAI_API_KEY")
+                if not api_key:
+                    raise RuntimeError("OPENAI_API_KEY is missing. Add it in Streamlit → Settings → Secrets or set it in the environment.")
+                from openai import OpenAI
+                _client = OpenAI(api_key=api_key)
+    return _client
+
+def set_client(c):
+    # Swap in a preconfigured (or fake) client; None resets to lazy construction
+    global _client
+    with _client_lock:
+        _client = c
+
+def _is_openai_error(e) -> bool:
+    # openai is only imported by get_client(); if it never loaded, e cannot be one of its errors
+    mod = sys.modules.get("openai")
+    return mod is not None and isinstance(e, mod.OpenAIError)
+
+def _is_status_error(e) -> bool:
+    mod = sys.modules.get("openai")
+    return mod is not None and isinstance(e, getattr(mod, "APIStatusError", mod.OpenAIError))
+
+def _chat_error(e) -> RuntimeError:
+    if _is_status_error(e):
         status = getattr(e, "status_code", "unknown")
         body = getattr(getattr(e, "response", None), "text", "") or str(e)
-        raise RuntimeError(f"Chat API error [{status}]: {body[:400]}")
-    except OpenAIError as e:
-        raise RuntimeError(f"Chat API error: {getattr(e, 'message', str(e))}")
+        return RuntimeError(f"Chat API error [{status}]: {body[:400]}")
+    return RuntimeError(f"Chat API error: {getattr(e, 'message', str(e))}")
+
+def _msg_bytes(messages) -> int:
+    return sum(len(str(m.get("content", "")).encode("utf-8")) for m in messages)
+
+def _note_usage(t: Dict, model: str, messages, content: str, usage=None):
+    # Tokens from the API's usage block when present, otherwise counted locally (flagged as estimated)
+    tin, tout = getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None)
+    if tin is None or tout is None:
+        enc = encoding_for(model)
+        tin = sum(len(enc.encode(str(m.get("content", "")), disallowed_special=())) for m in messages)
+        tout = len(enc.encode(content or "", disallowed_special=()))
+        t["tokens_estimated"] = True
+    t.update(tokens_in=tin, tokens_out=tout, bytes_out=len((content or "").encode("utf-8")),
+             cost_usd=trace.cost(model, tin, tout))
+
+def _chat_reserve(messages) -> int:
+    # ~4 bytes per token for the prompt plus a typical reply; settled against the reported usage afterwards
+    return _msg_bytes(messages) // 4 + CHAT_OUTPUT_TOKENS
+
+def _scheduled(model: str, tokens: int, level: int, t: Dict, max_retries: int, to_error, call):
+    # Queue for the shared per-model rate limit, then call; 429s and transient failures are retried with
+    # jittered backoff (a 429 pauses every caller of the model, as the server asked)
+    attempt = 0
+    while True:
+        grant = scheduler.acquire(model, tokens, level)
+        t["queue_ms"] = round(t.get("queue_ms", 0.0) + grant["queue_ms"], 2)
+        t.setdefault("queue_depth", grant["queue_depth"])
+        try:
+            result = call()
+            t["retries"] = attempt
+            return result
+        except Exception as e:
+            if not _is_openai_error(e):
+                raise
+            t["retries"] = attempt
+            if attempt >= max_retries or not _is_retryable(e):
+                raise to_error(e)
+            delay = _backoff_delay(attempt, e)
+            if getattr(e, "status_code", None) == 429:
+                scheduler.backoff(model, delay)
+            else:
+                time.sleep(delay)
+            attempt += 1
+
+def chat(messages, model: str = CHAT_MODEL, cache: bool = True):
+    # cache=False bypasses the lookup (e.g. "regenerate") but still stores the fresh answer
+    key = ResponseCache.key(model, messages)
+    with trace.span("chat", model, cache_hit=False, bytes_in=_msg_bytes(messages)) as t:
+        if cache:
+            hit = chat_cache.get(key)
+            if hit is not None:
+                t.update(cache_hit=True, bytes_out=len(hit.encode("utf-8")))
+                return hit
+        reserved = _chat_reserve(messages)
+        api = get_client().with_options(max_retries=0)
+        resp = _scheduled(model, reserved, scheduler.INTERACTIVE, t, CHAT_MAX_RETRIES, _chat_error,
+                          lambda: api.chat.completions.create(model=model, messages=messages))
+        content = resp.choices[0].message.content
+        _note_usage(t, model, messages, content, getattr(resp, "usage", None))
+        scheduler.settle(model, reserved, t["tokens_in"] + t["tokens_out"])
+        if content:
+            chat_cache.put(key, model, content)
+        return content
+
+def chat_stream(messages, model: str = CHAT_MODEL, cache: bool = True):
+    # Yields text deltas as they arrive; the assembled reply lands in the same cache as chat()
+    key = ResponseCache.key(model, messages)
+    with trace.span("chat", model, stream=True, cache_hit=False, bytes_in=_msg_bytes(messages)) as t:
+        if cache:
+            hit = chat_cache.get(key)
+            if hit is not None:
+                t.update(cache_hit=True, bytes_out=len(hit.encode("utf-8")))
+                yield hit
+                return
+        parts: List[str] = []
+        reserved = _chat_reserve(messages)
+        api = get_client().with_options(max_retries=0)
+        # Only opening the stream is retried; a reply that fails midway surfaces as an error
+        stream = _scheduled(model, reserved, scheduler.INTERACTIVE, t, CHAT_MAX_RETRIES, _chat_error,
+                            lambda: api.chat.completions.create(model=model, messages=messages, stream=True))
+        t0 = time.perf_counter()
+        try:
+            for event in stream:
+                if not event.choices:
+                    continue
+                delta = event.choices[0].delta.content
+                if delta:
+                    if not parts:
+                        t["ttft_ms"] = round(1000.0 * (time.perf_counter() - t0), 2)
+                    parts.append(delta)
+                    yield delta
+        except Exception as e:
+            if not _is_openai_error(e):
+                raise
+            raise _chat_error(e)
+        _note_usage(t, model, messages, "".join(parts))
+        scheduler.settle(model, reserved, t["tokens_in"] + t["tokens_out"])
+        if parts:
+            chat_cache.put(key, model, "".join(parts))
 
-def embed(texts: Union[str, List[str]], model: str = EMBED_MODEL, batch_size: int = 16):
+def embed(texts: Union[str, List[str]], model: str = EMBED_MODEL, batch_size: Optional[int] = None,
+          dimensions: Optional[int] = None, use_cache: bool = True,
+          progress: Optional[Callable[[int, int], None]] = None):
     if isinstance(texts, str):
         texts = [texts]
     clean: List[str] = [t if (t and t.strip()) else " " for t in texts]
-    out: List[List[float]] = []
-    i = 0
-    while i < len(clean):
-        batch = clean[i : i + batch_size]
+    # A single text is a search query someone is waiting on; anything longer is ingestion
+    level = scheduler.INTERACTIVE if len(clean) == 1 else scheduler.BULK
+    with trace.span("embed", model, inputs=len(clean), cache_hits=0) as tr:
+        if not use_cache:
+            return _embed_uncached(clean, model, batch_size, dimensions, progress, level)
+
+        keys = [EmbeddingCache.key(model, dimensions, t) for t in clean]
+        cached = embed_cache.get_many(keys)
+        # Each distinct uncached text goes to the API once, even if repeated within this call
+        todo = {}
+        for k, t in zip(keys, clean):
+            if k not in cached and k not in todo:
+                todo[k] = t
+        tr["cache_hits"] = len(clean) - len(todo)
+        if todo:
+            base = len(clean) - len(todo)
+            report = (lambda done, total: progress(base + done, len(clean))) if progress else None
+            fresh = _embed_uncached(list(todo.values()), model, batch_size, dimensions, report, level)
+            new = dict(zip(todo.keys(), fresh))
+            embed_cache.put_many(new.items())
+            cached.update(new)
+        elif progress:
+            progress(len(clean), len(clean))
+        return [cached[k] for k in keys]
+
+def embed_cache_stats():
+    return embed_cache.stats()
+
+def chat_cache_stats():
+    return chat_cache.stats()
+
+def _pack_batches(clean: List[str], model: str, max_items: int, max_tokens: int):
+    # Greedy packing by token count; over-long inputs are cut to the model's input limit.
+    # Returns (batches of indices, tokens per batch)
+    enc = encoding_for(model)
+    batches, sizes, cur, cur_tokens = [], [], [], 0
+    for i, t in enumerate(clean):
+        toks = enc.encode(t, disallowed_special=())
+        if len(toks) > EMBED_MAX_INPUT_TOKENS:
+            toks = toks[:EMBED_MAX_INPUT_TOKENS]
+            clean[i] = enc.decode(toks)
+        n = len(toks)
+        if cur and (len(cur) >= max_items or cur_tokens + n > max_tokens):
+            batches.append(cur)
+            sizes.append(cur_tokens)
+            cur, cur_tokens = [], 0
+        cur.append(i)
+        cur_tokens += n
+    if cur:
+        batches.append(cur)
+        sizes.append(cur_tokens)
+    return batches, sizes
+
+def _retry_after(e) -> Optional[float]:
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+def _is_retryable(e) -> bool:
+    status = getattr(e, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return _is_openai_error(e) and e.__class__.__name__ in ("APIConnectionError", "APITimeoutError")
+
+def _backoff_delay(attempt: int, e, base: float = 0.5, cap: float = 30.0) -> float:
+    # Full jitter, but never earlier than the server asked for
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    hint = _retry_after(e)
+    return max(delay, hint) if hint is not None else delay
+
+def _embed_error(e) -> RuntimeError:
+    if _is_status_error(e):
+        status = getattr(e, "status_code", "unknown")
+        body = getattr(getattr(e, "response", None), "text", "") or str(e)
+        hint = ""
+        if status == 401:
+            hint = " (Check OPENAI_API_KEY in Secrets; ensure org access.)"
+        elif status == 404:
+            hint = " (Embedding model not enabled; override EMBEDDING_MODEL in Secrets.)"
+        elif status == 429:
+            hint = " (Rate limit; retries exhausted — lower EMBED_CONCURRENCY or EMBED_BATCH_TOKENS.)"
+        return RuntimeError(f"Embeddings API error [{status}]: {body[:400]}{hint}")
+    return RuntimeError(f"Embeddings API error: {getattr(e, 'message', str(e))}")
+
+def _embed_batch(batch: List[str], model: str, dimensions: Optional[int], tokens: int = 0,
+                 level: int = scheduler.BULK):
+    extra = {"dimensions": dimensions} if dimensions else {}
+    api = get_client().with_options(max_retries=0)
+    with trace.span("embed_batch", model, items=len(batch), bytes_in=sum(len(t.encode("utf-8")) for t in batch)) as t:
+        resp = _scheduled(model, tokens, level, t, EMBED_MAX_RETRIES, _embed_error,
+                          lambda: api.embeddings.create(model=model, input=batch, **extra))
+        used = getattr(getattr(resp, "usage", None), "prompt_tokens", None)
+        scheduler.settle(model, tokens, used)
+        t.update(tokens_in=used, cost_usd=trace.cost(model, used or 0) if used else None)
+        return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
+
+def _embed_uncached(clean: List[str], model: str, batch_size: Optional[int], dimensions: Optional[int],
+                    progress: Optional[Callable[[int, int], None]] = None, level: int = scheduler.BULK):
+    clean = list(clean)
+    batches, sizes = _pack_batches(clean, model, batch_size or EMBED_BATCH_ITEMS, EMBED_BATCH_TOKENS)
+    out: List[Optional[List[float]]] = [None] * len(clean)
+    done = 0
+    if len(batches) == 1:
+        out = _embed_batch(clean, model, dimensions, sizes[0], level)
+        if progress:
+            progress(len(clean), len(clean))
+        return out
+    with ThreadPoolExecutor(max_workers=max(1, min(EMBED_CONCURRENCY, len(batches)))) as pool:
+        futs = {pool.submit(trace.propagate(_embed_batch), [clean[i] for i in b], model, dimensions, n, level): b
+                for b, n in zip(batches, sizes)}
         try:
-            resp = client.embeddings.create(model=model, input=batch)
-            out.extend([d.embedding for d in resp.data])
-            i += batch_size
-        except APIStatusError as e:
-            status = getattr(e, "status_code", "unknown")
-            body = getattr(getattr(e, "response", None), "text", "") or str(e)
-            hint = ""
-            if status == 401:
-                hint = " (Check OPENAI_API_KEY in Secrets; ensure org access.)"
-            elif status == 404:
-                hint = " (Embedding model not enabled; override EMBEDDING_MODEL in Secrets.)"
-            elif status == 429:
-                hint = " (Rate limit; retry or reduce batch_size.)"
-            raise RuntimeError(f"Embeddings API error [{status}]: {body[:400]}{hint}")
-        except OpenAIError as e:
-            if "rate" in str(e).lower():
-                time.sleep(2.0); continue
-            raise RuntimeError(f"Embeddings API error: {getattr(e, 'message', str(e))}")
+            for fut in as_completed(futs):
+                idx = futs[fut]
+                for i, v in zip(idx, fut.result()):
+                    out[i] = v
+                done += len(idx)
+                if progress:
+                    progress(done, len(clean))
+        except BaseException:
+            for f in futs:
+                f.cancel()
+            raise
     return out
 
 def generate_image(prompt: str, size: str = "1024x1024") -> bytes:
-    try:
-        resp = client.images.generate(model=IMAGE_MODEL, prompt=prompt, size=size)
-        b64 = resp.data[0].b64_json
-        import base64 as _b64
-        return _b64.b64decode(b64)
-    except Exception as e:
-        raise RuntimeError(f"Image generation error: {e}")
+    with trace.span("image", IMAGE_MODEL, size=size, bytes_in=len(prompt.encode("utf-8"))) as t:
+        try:
+            api = get_client().with_options(max_retries=0)
+            resp = _scheduled(IMAGE_MODEL, 0, scheduler.BACKGROUND, t, IMAGE_MAX_RETRIES, lambda e: e,
+                              lambda: api.images.generate(model=IMAGE_MODEL, prompt=prompt, size=size))
+            b64 = resp.data[0].b64_json
+            import base64 as _b64
+            data = _b64.b64decode(b64)
+            t.update(bytes_out=len(data), cost_usd=trace.cost(IMAGE_MODEL, images=1, size=size))
+            return data
+        except Exception as e:
+            raise RuntimeError(f"Image generation error: {e}")
+
+def generate_images(jobs: Dict[str, Tuple[str, str]], max_workers: Optional[int] = None
+                    ) -> Iterator[Tuple[str, Optional[bytes], Optional[Exception]]]:
+    # jobs: {key: (prompt, size)}. Yields (key, png_bytes, None) or (key, None, error) in completion order;
+    # one failure never cancels the others
+    if not jobs:
+        return
+    workers = max(1, min(max_workers or IMAGE_CONCURRENCY, len(jobs)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futs = {pool.submit(trace.propagate(generate_image), prompt, size): key for key, (prompt, size) in jobs.items()}
+        for fut in as_completed(futs):
+            try:
+                yield futs[fut], fut.result(), None
+            except Exception as e:
+                yield futs[fut], None, e
@@ -0,0 +1,135 @@
+# Prompt builders shared by the Streamlit pages and the headless pipeline (core.batch).
+# The text is kept byte-identical to what the pages sent before, so cached responses stay valid.
+
+def draft_prompt(base: str, answers_text: str) -> str:
+    return f"""You are a professional case study writer for public-sector finance.
+    Using the CONTEXT (from uploaded files) and the USER ANSWERS (provided via a form), draft a polished, visually engaging case study with the following sections:
+
+    1) Captivating Title
+    2) Executive Summary (3–5 sentences)
+    3) Problem / Need for the project
+    4) Implementation Approach (timeline, roles, tools, governance)
+    5) Benefits & Impact (quantify where possible, use bullets if helpful)
+    6) Key Learning Points (bulleted)
+    7) Point of Contact (POC: name, role, email — use placeholders if missing)
+    8) Suggested Visuals/Diagrams (list 2–3 ideas)
+
+    CONTEXT:
+    {base}
+
+    USER ANSWERS:
+    {answers_text}
+
+    Return **Markdown only**.
+    """
+
+def diagram_prompts_prompt(draft: str) -> str:
+    return f"""
+    From the following case study markdown, list three concise prompts for diagrams/flowcharts to visualise the process and impact.
+    Return bullet points only (max 3 prompts).
+    ---
+    {draft[:5000]}
+    ---
+    """
+
+def cover_image_prompt(style: str, theme: str) -> str:
+    return f"A {style} depicting {theme}. Clean, professional, government context, minimal color palette."
+
+def diagram_image_prompt(p: str) -> str:
+    return f"Professional flowchart or process diagram showing: {p}. Use minimal style, government finance context."
+
+def answers_text(answers: dict) -> str:
+    return "\n".join([f"- {k}: {v}" for k,v in answers.items() if v.strip()])
+
+CASE_FIELDS = ["title", "summary", "problem", "implementation", "benefits", "learnings", "poc", "visuals"]
+
+def case_fields_prompt(base: str, answers_text: str) -> str:
+    # Headless drafting: ask for the CASE_TEMPLATE fields as JSON and render them with core.utils.build_case_study
+    return f"""You are a professional case study writer for public-sector finance.
+    Using the CONTEXT (from uploaded files) and the USER ANSWERS, draft a polished case study.
+    Return a single JSON object with these string fields (Markdown allowed inside values):
+    "title" (captivating), "summary" (3–5 sentences), "problem", "implementation" (timeline, roles, tools, governance),
+    "benefits" (quantify where possible), "learnings" (bulleted), "poc" (name, role, email — placeholders if missing),
+    "visuals" (2–3 diagram ideas as bullets).
+
+    CONTEXT:
+    {base}
+
+    USER ANSWERS:
+    {answers_text or "(none provided)"}
+
+    Return JSON only.
+    """
+
+# Map-reduce gap analysis (core.analysis): every chunk is reviewed against this checklist, then gaps are asked about
+CHECKLIST = {
+    "title": "title direction: the initiative's name, agency and headline outcome",
+    "summary": "executive summary angle: what was done, for whom, and why it matters",
+    "problem": "problem clarity: the need, pain points and baseline before the project",
+    "implementation": "implementation specifics: timeline, roles, tools, governance",
+    "benefits": "benefits with metrics: savings, time reductions, quality or service gains",
+    "learnings": "learning points: lessons, challenges and what others should replicate",
+    "poc": "point of contact: name, role and email",
+}
+
+def coverage_map_prompt(excerpt: str) -> str:
+    checklist = "\n".join(f'    - "{k}": {v}' for k, v in CHECKLIST.items())
+    return f"""You are reviewing source material for a public-sector finance **case study**.
+    From the EXCERPT below, extract the facts that would help write each checklist section:
+{checklist}
+    Return a single JSON object mapping section keys to lists of short factual statements (max 5 each).
+    Omit sections the excerpt says nothing about. Do not invent facts.
+    EXCERPT:
+    ---
+    {excerpt}
+    ---
+    Return JSON only.
+    """
+
+def coverage_gap_prompt(coverage: str) -> str:
+    return f"""You are assisting to prepare a public-sector finance **case study**.
+    Below is what the uploaded material already covers, per section, merged from a review of every document.
+    List the **missing information** that we must ask the user **as bullet questions**. Do not ask about anything already covered.
+    Coverage:
+    ---
+    {coverage}
+    ---
+    Return only bullet questions (can be 0, max 3).
+    """
+
+# Section-wise drafting (core.drafting): one call per CASE_FIELDS entry, each with its own retrieval hint
+# and the user answers whose questions mention its keywords
+SECTION_SPECS = {
+    "title": {"label": "Title", "ask": "a captivating case study title. Return the title text only, on one line.",
+              "hint": "initiative name agency outcome", "keywords": ["title", "name", "initiative", "project"]},
+    "summary": {"label": "Executive Summary", "ask": "an executive summary of 3–5 sentences.",
+                "hint": "overview outcome results", "keywords": ["summary", "overview", "outcome", "result"]},
+    "problem": {"label": "Problem / Need", "ask": "the problem or need the project addressed.",
+                "hint": "problem challenge need pain points baseline", "keywords": ["problem", "need", "challenge", "why", "baseline"]},
+    "implementation": {"label": "Implementation Approach", "ask": "the implementation approach: timeline, roles, tools, governance.",
+                       "hint": "implementation timeline roles tools governance rollout",
+                       "keywords": ["implement", "timeline", "role", "tool", "governance", "team", "vendor", "rollout"]},
+    "benefits": {"label": "Benefits & Impact", "ask": "benefits and impact; quantify where possible, use bullets if helpful.",
+                 "hint": "benefits impact savings metrics results", "keywords": ["benefit", "impact", "saving", "metric", "kpi", "result"]},
+    "learnings": {"label": "Key Learning Points", "ask": "key learning points, as bullets.",
+                  "hint": "lessons learned challenges recommendations", "keywords": ["learn", "lesson", "challenge", "recommend"]},
+    "poc": {"label": "Point of Contact", "ask": "the point of contact (name, role, email — use placeholders if missing).",
+            "hint": "contact name role email", "keywords": ["contact", "poc", "email", "name", "role"]},
+    "visuals": {"label": "Suggested Visuals / Diagrams", "ask": "2–3 ideas for visuals or diagrams, as bullets.",
+                "hint": "process workflow figures data", "keywords": ["visual", "diagram", "chart"]},
+}
+
+def section_prompt(field: str, base: str, answers_text: str) -> str:
+    spec = SECTION_SPECS[field]
+    return f"""You are a professional case study writer for public-sector finance.
+    Write only the **{spec["label"]}** section of a case study: {spec["ask"]}
+    Use the CONTEXT (from uploaded files) and the USER ANSWERS; do not invent figures that neither contains.
+
+    CONTEXT:
+    {base}
+
+    USER ANSWERS:
+    {answers_text or "(none provided)"}
+
+    Return **Markdown only**, without a section heading.
+    """
@@ -1,79 +1,664 @@
-import os, faiss, numpy as np
-from typing import List, Dict
+import os, json, time, hashlib, threading
+from contextlib import contextmanager
+from typing import List, Dict, Optional, Tuple
+try:
+    import fcntl
+except ImportError:   # Windows: only the in-process lock applies
+    fcntl = None
 from core.llm import embed
-from io import BytesIO
-from PyPDF2 import PdfReader
-from docx import Document
+from core import ann, config, trace
+from core.lexical import BM25Index, rrf
+from core.store import ChunkStore
+from core.tokens import count_tokens
+from core.chunking import Deduper, iter_chunks, PAGE_BREAK
+from core.extract import iter_pages, new_report
 
-INDEX_PATH = "data/index.faiss"
-META_PATH  = "data/meta.npy"
+DATA_DIR   = "data"
+VEC_PATH   = os.path.join(DATA_DIR, "vectors.f32")   # append-only float32 rows, row i <-> chunk id i
+STORE_PATH = os.path.join(DATA_DIR, "chunks.sqlite") # chunk text + metadata by id (core.store)
+INFO_PATH  = os.path.join(DATA_DIR, "index.json")    # commit header: {"dim", "generation", "rows", "deletions", "snapshot"}
+LOCK_PATH  = os.path.join(DATA_DIR, "index.lock")    # advisory lock held by the one writer committing
+SNAPSHOT_LOCK_PATH = os.path.join(DATA_DIR, "snapshot.lock")
+MANIFEST_PATH = os.path.join(DATA_DIR, "manifest.json")  # {sha256(file bytes): ingest record}
+LEGACY_KEY = "legacy:"   # manifest key prefix for migrated files indexed before digests were kept
+# Drafting context: token budget, MMR candidate pool and relevance/diversity trade-off (1.0 = relevance only)
+CONTEXT_TOKENS     = int(config.get("CONTEXT_TOKENS", 2500))
+CONTEXT_CANDIDATES = int(config.get("CONTEXT_CANDIDATES", 40))
+MMR_LAMBDA         = float(config.get("MMR_LAMBDA", 0.7))
+# "hybrid" fuses BM25 and vector rankings; "lexical" answers without an embeddings call; "dense" is vectors only
+RETRIEVAL_MODE     = str(config.get("RETRIEVAL_MODE", "hybrid")).lower()
+# Shortened embeddings via the API's `dimensions` (0 = the model's full size); fixed once data/ holds vectors
+EMBED_DIMENSIONS   = int(config.get("EMBED_DIMENSIONS", 0))
+# Once this many rows (added or deleted) differ from the on-disk snapshot, a fresh one is written for
+# readers to memory-map (0 = never)
+INDEX_SNAPSHOT_ROWS = int(config.get("INDEX_SNAPSHOT_ROWS", 5000))
+# Earlier layouts, moved into the chunk store on first load: one JSON line per chunk, and before that
+# a FAISS index file with a pickled metadata array
+MLOG_PATH  = os.path.join(DATA_DIR, "meta.jsonl")
+INDEX_PATH = os.path.join(DATA_DIR, "index.faiss")
+META_PATH  = os.path.join(DATA_DIR, "meta.npy")
 
-def _load_index():
-    if not os.path.exists(INDEX_PATH):
-        return None, []
-    index = faiss.read_index(INDEX_PATH)
-    meta  = np.load(META_PATH, allow_pickle=True).tolist()
-    return index, meta
-
-def _save_index(index, meta):
-    os.makedirs("data", exist_ok=True)
-    faiss.write_index(index, INDEX_PATH)
-    np.save(META_PATH, np.array(meta, dtype=object), allow_pickle=True)
-
-def chunk(text, size=800, overlap=120):
-    toks = text.split()
-    out=[]
-    i=0
-    while i<len(toks):
-        out.append(" ".join(toks[i:i+size]))
-        i += size-overlap
-    return out
+store = ChunkStore(STORE_PATH)
+
+# One index per process, shared by every Streamlit session. Chunk text stays in the store: memory holds
+# the vectors' index, BM25 postings, SimHashes for dedupe and the ids of deleted chunks
+_lock = threading.RLock()
+_state = {"index": None, "rows": 0, "dim": None, "sig": None, "generation": 0, "deletions": 0,
+          "deleted": set(), "vec_ino": None, "snapshot": None, "dedupe": Deduper(), "bm25": BM25Index()}
+
+def _file_sig():
+    # Every commit atomically replaces the header, so its identity changes exactly when there is something new
+    try:
+        st_ = os.stat(INFO_PATH)
+        return st_.st_size, st_.st_mtime_ns, st_.st_ino
+    except FileNotFoundError:
+        return None
+
+def _reset_state():
+    _state.update(index=None, rows=0, dim=None, sig=None, generation=0, deletions=0, deleted=set(), vec_ino=None,
+                  snapshot=None, dedupe=Deduper(), bm25=BM25Index())
 
-def extract_text(file_bytes: bytes, filename: str) -> str:
-    name = filename.lower()
+@contextmanager
+def _file_lock(path: str, blocking: bool = True):
+    # Advisory lock shared by every process using data/; yields False when non-blocking and already held
+    os.makedirs(DATA_DIR, exist_ok=True)
+    with open(path, "a+b") as f:
+        if fcntl is None:
+            yield True
+            return
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _read_header() -> Optional[Dict]:
     try:
-        if name.endswith(".pdf"):
-            text_parts = []
-            reader = PdfReader(BytesIO(file_bytes))
-            if reader.is_encrypted:
-                try: reader.decrypt("")
-                except Exception: pass
-            for page in reader.pages:
-                text_parts.append(page.extract_text() or "")
-            return "\n".join(text_parts).strip()
-        elif name.endswith(".docx"):
-            doc = Document(BytesIO(file_bytes))
-            return "\n".join(p.text for p in doc.paragraphs if p.text).strip()
+        with open(INFO_PATH) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _write_header(header: Dict):
+    tmp = f"{INFO_PATH}.tmp{os.getpid()}.{threading.get_ident()}"
+    with open(tmp, "w") as f:
+        json.dump(header, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, INFO_PATH)
+
+def _migrate_jsonl():
+    # meta.jsonl -> chunk store, once, for the rows its header committed (or, for headers that only carry
+    # "dim", the complete lines present in both files)
+    if not os.path.exists(MLOG_PATH):
+        return
+    with _file_lock(LOCK_PATH):
+        header = _read_header()
+        if not os.path.exists(MLOG_PATH) or header is None:
+            return
+        try:
+            rows = header.get("rows", os.path.getsize(VEC_PATH) // (4 * header["dim"]))
+        except FileNotFoundError:
+            rows = 0
+        records = []
+        with open(MLOG_PATH, "rb") as f:
+            for line in f:
+                if len(records) >= rows or not line.endswith(b"\n"):
+                    break
+                records.append(json.loads(line))
+        store.put(0, records)
+        header.pop("meta_bytes", None)
+        header.update(rows=len(records), generation=header.get("generation", 0) + 1)
+        _write_header(header)
+        os.replace(MLOG_PATH, MLOG_PATH + ".bak")
+    _record_manifest(_legacy_entries(records))
+
+def _migrate_legacy():
+    # index.faiss + meta.npy -> vectors.f32 + chunk store, once. The pickled array is this app's own file
+    # from before index.json existed; nothing else is ever loaded with allow_pickle
+    if os.path.exists(INFO_PATH) or not os.path.exists(INDEX_PATH):
+        return
+    import faiss, numpy as np
+    with _file_lock(LOCK_PATH):
+        if os.path.exists(INFO_PATH) or not os.path.exists(INDEX_PATH):
+            return   # another process migrated while we waited
+        index = faiss.read_index(INDEX_PATH)
+        meta = np.load(META_PATH, allow_pickle=True).tolist() if os.path.exists(META_PATH) else []
+        n = min(index.ntotal, len(meta))
+        if n:
+            _append_locked(index.reconstruct_n(0, n).astype("float32"), meta[:n])
+        for p in (INDEX_PATH, META_PATH):
+            if os.path.exists(p):
+                os.replace(p, p + ".bak")
+    _record_manifest(_legacy_entries(meta[:n]))
+
+def _legacy_entries(records: List[Dict]) -> Dict[str, Dict]:
+    # Chunks migrated from before the manifest carry no file digest: list them under their filename so
+    # the Indexed documents panel shows them and remove_document() can delete them
+    entries: Dict[str, Dict] = {}
+    for r in records:
+        if r.get("digest"):
+            continue
+        name = r.get("filename") or "(unnamed)"
+        e = entries.setdefault(LEGACY_KEY + name, {"filename": name, "bytes": None, "chunks": 0,
+                                                   "source": r.get("source"), "ingested_at": None,
+                                                   "preview": r.get("text", "")[:1500]})
+        e["chunks"] += 1
+    return entries
+
+def _migrate():
+    # Earlier layouts are converted by whichever call reaches data/ first, so listing or deleting documents
+    # before anything has searched still sees the migrated chunks
+    _migrate_legacy()
+    _migrate_jsonl()
+
+def _check_dim(stored: int, got: int):
+    if stored != got:
+        raise RuntimeError(f"The index holds {stored}-dimensional vectors but embeddings are {got}-dimensional "
+                           "(EMBEDDING_MODEL or EMBED_DIMENSIONS changed); re-ingest into an empty data/ directory.")
+
+def _append(vecs: "np.ndarray", records: List[Dict]) -> Dict:
+    """Single-writer commit: under the file lock, write the chunks at ids past the last commit (replacing
+    whatever a crashed writer left there), cut the vector file back to the commit and append, fsync, then
+    publish the new generation by renaming the header over the old one."""
+    with _file_lock(LOCK_PATH):
+        return _append_locked(vecs, records)
+
+def _append_locked(vecs: "np.ndarray", records: List[Dict]) -> Dict:
+    import numpy as np
+    header = _read_header() or {"dim": int(vecs.shape[1]), "rows": 0}
+    _check_dim(header["dim"], vecs.shape[1])
+    rows = header["rows"]
+    store.put(rows, records)
+    with open(VEC_PATH, "ab") as f:
+        f.truncate(rows * 4 * header["dim"])
+        f.write(np.ascontiguousarray(vecs, dtype="float32").tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    header.update(generation=header.get("generation", 0) + 1, rows=rows + len(records))
+    _write_header(header)
+    return header
+
+def _maybe_snapshot(header: Dict):
+    snap = header.get("snapshot") or {}
+    changed = header["rows"] - snap.get("rows", 0) + header.get("deletions", 0) - snap.get("deletions", 0)
+    if INDEX_SNAPSHOT_ROWS and changed >= INDEX_SNAPSHOT_ROWS:
+        threading.Thread(target=_write_snapshot, args=(header,), daemon=True).start()
+
+def _write_snapshot(header: Dict):
+    # Committed rows never change, so the build runs outside the commit lock; one builder at a time.
+    # Built from live rows only, with their ids mapped, so deletions are compacted away here
+    import faiss, numpy as np
+    rows, dim, generation, deletions = header["rows"], header["dim"], header["generation"], header.get("deletions", 0)
+    with _file_lock(SNAPSHOT_LOCK_PATH, blocking=False) as mine:
+        if not mine:
+            return
+        live = np.setdiff1d(np.arange(rows, dtype="int64"), np.array(store.deleted(rows), dtype="int64"))
+        backend, codec = ann.choose_backend(len(live)), ann.choose_codec(len(live))
+        with trace.span("snapshot", backend, rows=rows, live=len(live), codec=codec) as t:
+            vecs = np.memmap(VEC_PATH, dtype="float32", mode="r", shape=(rows, dim))
+            index = ann.build_index(vecs[live], backend, ids=live, codec=codec)
+            name = f"snapshot-{generation}.faiss"
+            tmp = os.path.join(DATA_DIR, f"{name}.tmp{os.getpid()}")
+            faiss.write_index(index, tmp)
+            os.replace(tmp, os.path.join(DATA_DIR, name))
+            t["bytes_out"] = os.path.getsize(os.path.join(DATA_DIR, name))
+            with _file_lock(LOCK_PATH):
+                current = _read_header()
+                old = current.get("snapshot") or {}
+                if old.get("generation", 0) >= generation:
+                    stale = name
+                else:
+                    current["snapshot"] = {"file": name, "rows": rows, "live": len(live), "deletions": deletions,
+                                           "backend": backend, "codec": codec, "generation": generation}
+                    _write_header(current)
+                    stale = old.get("file")
+        # Readers still mapping the old file keep their pages until they move to the new one
+        if stale:
+            try:
+                os.remove(os.path.join(DATA_DIR, stale))
+            except FileNotFoundError:
+                pass
+
+def _read_tail(header: Dict):
+    import numpy as np
+    # Pull in rows committed since the last refresh (by this or another process); ids past the header's
+    # row count belong to a commit still in flight and are left alone
+    _state["dim"] = int(header["dim"])
+    start, rows = _state["rows"], header["rows"]
+    _state["generation"] = header.get("generation", 0)
+    new_ids = None
+    if rows > start:
+        texts, live = [], []
+        for i, text, simhash in store.scan(start, rows):
+            texts.append(text)
+            if text is None:
+                _state["deleted"].add(i)
+                continue
+            live.append(i)
+            if simhash is not None:
+                _state["dedupe"].add(simhash)
+        _state["bm25"].add(texts)
+        _state["rows"] = rows
+        new_ids = np.array(live, dtype="int64")
+    snap = header.get("snapshot")
+    index = _state["index"]
+    if snap and snap["file"] != _state["snapshot"]:
+        # A newer on-disk snapshot: map it and keep only the rows after it in RAM
+        try:
+            base = ann.open_snapshot(os.path.join(DATA_DIR, snap["file"]))
+        except RuntimeError:
+            base = None   # replaced again since the header was read; the next refresh picks up its successor
+        if base is not None and base.ntotal == snap.get("live", snap["rows"]):
+            delta = np.array([i for i in range(snap["rows"], rows) if i not in _state["deleted"]], dtype="int64")
+            _state["index"] = ann.Layered(base, _vectors()[delta], delta)
+            _state["snapshot"] = snap["file"]
+            return
+    if new_ids is None and index is not None:
+        return
+    live_n = _state["rows"] - len(_state["deleted"])
+    backend, codec = ann.choose_backend(live_n), ann.choose_codec(live_n)
+    if index is None or (_state["snapshot"] is None and (ann.backend_of(index), ann.codec_of(index)) != (backend, codec)):
+        # First load or crossed the promotion / compression threshold: (re)build over the whole corpus
+        ids = np.array([i for i in range(_state["rows"]) if i not in _state["deleted"]], dtype="int64")
+        _state["index"] = ann.build_index(_vectors()[ids], backend, ids=ids, codec=codec)
+    elif len(new_ids):
+        index.add_with_ids(np.ascontiguousarray(_vectors()[new_ids]), new_ids)
+
+def _vectors() -> "np.ndarray":
+    import numpy as np
+    if _state["dim"] is None or not _state["rows"]:
+        return np.zeros((0, _state["dim"] or 0), dtype="float32")
+    return np.memmap(VEC_PATH, dtype="float32", mode="r", shape=(_state["rows"], _state["dim"]))
+
+def _resident():
+    # -> (index or None, committed row count); chunk ids below that count are safe to look up in the store
+    with _lock:
+        _migrate()
+        sig = _file_sig()
+        if sig == _state["sig"]:
+            return _state["index"], _state["rows"]
+        header = _read_header() if sig else None
+        if header is None:
+            _reset_state()
         else:
-            return file_bytes.decode("utf-8", errors="ignore")
-    except Exception:
-        return file_bytes.decode("utf-8", errors="ignore")
-
-def upsert_documents(docs: List[Dict]):
-    texts = [d["text"] for d in docs]
-    metas = [d["meta"] for d in docs]
-    chunks, meta_chunks = [], []
-    for t, m in zip(texts, metas):
-        for c in chunk(t):
-            if c and c.strip():
-                chunks.append(c); meta_chunks.append(m)
-
-    if not chunks:
+            try:
+                vec_ino = os.stat(VEC_PATH).st_ino
+            except FileNotFoundError:
+                vec_ino = None
+            # Files replaced or rewritten shorter underneath us, or chunks deleted: start over
+            if (header["rows"] < _state["rows"] or header.get("deletions", 0) != _state["deletions"]
+                    or (_state["vec_ino"] is not None and vec_ino != _state["vec_ino"])):
+                _reset_state()
+            _state["vec_ino"] = vec_ino
+            _state["deletions"] = header.get("deletions", 0)
+            if vec_ino is not None:
+                _read_tail(header)
+        _state["sig"] = sig
+        return _state["index"], _state["rows"]
+
+def resident_vectors() -> "np.ndarray":
+    with _lock:
+        _resident()
+        return _vectors()
+
+_manifest = {"entries": {}, "sig": None}
+
+def _load_manifest() -> Dict[str, Dict]:
+    # Re-read only when another session/process has rewritten the file
+    with _lock:
+        try:
+            st_ = os.stat(MANIFEST_PATH)
+            sig = (st_.st_size, st_.st_mtime_ns, st_.st_ino)
+        except FileNotFoundError:
+            sig = None
+        if sig != _manifest["sig"]:
+            if sig is None:
+                entries = {}
+            else:
+                with open(MANIFEST_PATH, encoding="utf-8") as f:
+                    entries = json.load(f)
+            _manifest.update(entries=entries, sig=sig)
+        return _manifest["entries"]
+
+def _record_manifest(new: Dict[str, Dict], drop=()):
+    if not new and not drop:
         return
-    vecs = np.array(embed(chunks), dtype="float32")
-    index, meta = _load_index()
-    if index is None:
-        index = faiss.IndexFlatIP(vecs.shape[1])
+    with _lock, _file_lock(LOCK_PATH):
+        _manifest["sig"] = None   # re-read under the lock: another process may have just written it
+        entries = {**_load_manifest(), **new}
+        for digest in drop:
+            entries.pop(digest, None)
+        tmp = MANIFEST_PATH + f".tmp{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False)
+        os.replace(tmp, MANIFEST_PATH)
+        _manifest["sig"] = None
+        _load_manifest()
+
+def file_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def indexed_documents() -> List[Dict]:
+    # Manifest entries, newest first: {"digest", "filename", "bytes", "chunks", "source", "ingested_at", ...}
+    with _lock:
+        _migrate()
+    docs = [{"digest": d, **e} for d, e in _load_manifest().items()]
+    return sorted(docs, key=lambda e: e.get("ingested_at") or "", reverse=True)
+
+def delete_documents(filters: Dict) -> List[Dict]:
+    """Remove every chunk matching filters (e.g. {"digest": d}, {"filename": [...]}, {"source": s}).
+
+    Chunks are tombstoned in the store and dropped from search at once; their vectors leave the index
+    at the next snapshot or reload. Returns [{"digest", "filename", "chunks"}] per document removed."""
+    with _lock:
+        _migrate()
+        with _file_lock(LOCK_PATH):
+            header = _read_header()
+            removed = store.delete(filters, header["rows"]) if header else []
+            if removed:
+                n = sum(r["chunks"] for r in removed)
+                header.update(generation=header.get("generation", 0) + 1, deletions=header.get("deletions", 0) + n)
+                _write_header(header)
+        if not removed:
+            return []
+        # Files with nothing left indexed can be uploaded again; migrated files go by filename
+        digests = {r["digest"] for r in removed if r["digest"]}
+        known = _load_manifest()
+        legacy = {LEGACY_KEY + r["filename"] for r in removed if not r["digest"] and LEGACY_KEY + str(r["filename"]) in known
+                  and not store.ids({"filename": r["filename"], "digest": None}, header["rows"])}
+        _record_manifest({}, drop=(digests - store.live_digests(digests, header["rows"])) | legacy)
+        _resident()
+    _maybe_snapshot(header)
+    trace.record("delete", "", chunks=sum(r["chunks"] for r in removed), documents=len(removed), ok=True)
+    return removed
+
+def remove_document(digest: str) -> List[Dict]:
+    # One manifest entry's chunks; files indexed before chunks carried their digest go by original filename
+    entry = _load_manifest().get(digest)
+    removed = delete_documents({"digest": digest})
+    if not removed and entry is not None:
+        removed = delete_documents({"filename": entry["filename"], "digest": None})
+        _record_manifest({}, drop=[digest])
+    return removed
+
+def chunk(text, size=None, overlap=None):
+    # Token-sized, structure-aware chunks (see core.chunking.iter_chunks); size/overlap are in tokens
+    kw = {k: v for k, v in (("max_tokens", size), ("overlap", overlap)) if v is not None}
+    return [c["text"] for c in iter_chunks(text, **kw)]
+
+def extract_text(file_bytes: bytes, filename: str, report: Dict = None) -> str:
+    # PDF pages are joined with form feeds so the chunker can keep page numbers; DOCX sections with blank lines
+    parts, paged = [], False
+    with trace.span("extract", filename, bytes_in=len(file_bytes)) as t:
+        for page_no, text in iter_pages(file_bytes, filename, report):
+            parts.append(text)
+            paged = paged or page_no is not None
+        out = (PAGE_BREAK if paged else "\n\n").join(parts).strip()
+        t.update(pages=len(parts), bytes_out=len(out.encode("utf-8")))
+    return out
+
+def _chunk_records(doc: Dict, dedupe: Deduper) -> List[Dict]:
+    records = []
+    # "pages" may be a lazy iter_pages() stream; "text" is a plain or form-feed-paged string
+    for c in iter_chunks(doc.get("pages") or doc["text"], dedupe=dedupe):
+        rec = {"text": c["text"], **doc["meta"], "simhash": c["simhash"], "tokens": c["tokens"]}
+        if c["page"] is not None:
+            rec["page"] = c["page"]
+        records.append(rec)
+    return records
+
+def _corpus_deduper() -> Deduper:
+    with _lock:
+        _resident()
+        return Deduper(parent=_state["dedupe"])
+
+def _commit(records: List[Dict], progress=None):
+    import faiss, numpy as np
+    # One embed pass and one append for the whole batch
+    if not records:
+        return
+    vecs = np.array(embed([r["text"] for r in records], dimensions=EMBED_DIMENSIONS or None, progress=progress), dtype="float32")
     faiss.normalize_L2(vecs)
-    index.add(vecs)
-    meta.extend([{"text": c, **mc} for c, mc in zip(chunks, meta_chunks)])
-    _save_index(index, meta)
+    with _lock:
+        _resident()
+        header = _append(vecs, records)
+        _resident()
+    _maybe_snapshot(header)
+
+def upsert_documents(docs: List[Dict], progress=None):
+    dedupe = _corpus_deduper()
+    records = []
+    for d in docs:
+        records.extend(_chunk_records(d, dedupe))
+    _commit(records, progress)
+
+def ingest_files(files: List[Tuple[str, bytes]], source: str = "user_upload", progress=None,
+                 preview_chars: int = 1500) -> Dict:
+    """Extract, chunk and embed every (filename, bytes) of one upload, then commit them in a single write."""
+    t_start = time.perf_counter()
+    dedupe = _corpus_deduper()
+    known = _load_manifest()
+    records, per_file, skipped, new_entries = [], [], [], {}
+    for name, data in files:
+        digest = file_digest(data)
+        prior = known.get(digest) or new_entries.get(digest)
+        if prior is not None:
+            # Same bytes already indexed (any filename, any session): nothing to extract or embed
+            skipped.append({"filename": name, "digest": digest, "indexed_as": prior["filename"],
+                            "ingested_at": prior.get("ingested_at"), "preview": prior.get("preview", "")})
+            continue
+        report = new_report(name)
+        head: List[str] = []
+        def pages(report=report, name=name, data=data, head=head):
+            for page_no, text in iter_pages(data, name, report):
+                if sum(len(h) for h in head) < preview_chars:
+                    head.append(text)
+                yield page_no, text
+        t0 = time.perf_counter()
+        dropped = dedupe.dropped
+        recs = _chunk_records({"pages": pages(), "meta": {"filename": name, "source": source, "digest": digest}}, dedupe)
+        records.extend(recs)
+        per_file.append({
+            **report,
+            "digest": digest,
+            "bytes": len(data),
+            "chunks": len(recs),
+            "duplicates_dropped": dedupe.dropped - dropped,
+            "chunk_seconds": time.perf_counter() - t0 - report["seconds"],
+            "preview": "\n\n".join(h.strip() for h in head if h.strip())[:preview_chars],
+        })
+        # Extraction and chunking interleave page by page, so both are recorded from the file's report
+        trace.record("extract", name, ms=round(1000.0 * report["seconds"], 2), bytes_in=len(data),
+                     pages=report["pages"], parallel=report["parallel"], ok=not report["errors"])
+        trace.record("chunk", name, ms=round(1000.0 * per_file[-1]["chunk_seconds"], 2), chunks=len(recs),
+                     duplicates_dropped=per_file[-1]["duplicates_dropped"], ok=True)
+        if report["errors"] and not recs:
+            continue   # failed extraction: leave it out of the manifest so a retry re-reads it
+        new_entries[digest] = {"filename": name, "bytes": len(data), "chunks": len(recs), "source": source,
+                               "ingested_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "preview": per_file[-1]["preview"]}
+    t_embed = time.perf_counter()
+    _commit(records, progress)
+    _record_manifest(new_entries)
+    total = time.perf_counter() - t_start
+    embed_s = time.perf_counter() - t_embed
+    n_bytes = sum(f["bytes"] for f in per_file)
+    return {
+        "files": per_file,
+        "skipped": skipped,
+        "chunks": len(records),
+        "seconds": total,
+        "extract_seconds": sum(f["seconds"] for f in per_file),
+        "embed_commit_seconds": embed_s,
+        "chunks_per_s": len(records) / total if total else 0.0,
+        "mb_per_s": (n_bytes / 1e6) / total if total else 0.0,
+    }
+
+def chunks_for(filters: Dict) -> List[Dict]:
+    # Every indexed chunk matching the metadata filters, in ingestion order
+    _, rows = _resident()
+    return [rec for _, rec in store.find(filters, rows)]
+
+def chunks_for_upload(summary: Dict) -> List[Dict]:
+    # All chunks behind one ingest_files() summary, including files skipped as already indexed
+    digests = {f["digest"] for f in summary["files"]} | {s["digest"] for s in summary["skipped"]}
+    found = chunks_for({"digest": digests})
+    # Files indexed before chunks carried their digest are matched by their original filename
+    missing = {s["indexed_as"] for s in summary["skipped"]} - {r.get("filename") for r in found}
+    if missing:
+        found += [r for r in chunks_for({"filename": missing}) if "digest" not in r]
+    return found
 
-def query(q: str, k=6):
-    index, meta = _load_index()
+def _allowed(filters: Dict, rows: int) -> Optional[set]:
+    # Ids passing the metadata filters, from the store's indexed columns (None = no filter)
+    return set(store.ids(filters, rows)) if filters else None
+
+def _dense(q: str, k: int, filters: Dict = None, allowed: Optional[set] = None):
+    # -> (unit query vector, row ids best-first)
+    import faiss, numpy as np
+    qv = np.array(embed(q, dimensions=EMBED_DIMENSIONS or None)[0], dtype="float32").reshape(1, -1)
+    faiss.normalize_L2(qv)
+    # Under the lock, like _lexical: _read_tail adds to this same index and deleted set in place
+    with _lock:
+        index, rows = _resident()
+        deleted = _state["deleted"]
+        if allowed is None and filters:
+            allowed = _allowed(filters, rows)
+        _check_dim(index.d, qv.shape[1])
+        if not index.ntotal:
+            return qv[0], []
+        keep = lambda i: 0 <= i < rows and i not in deleted and (allowed is None or i in allowed)
+        # Compressed codes only shortlist: the top k*RERANK_FACTOR are rescored from the float32 rows on disk
+        codec = ann.codec_of(index)
+        want = k * ann.RERANK_FACTOR if codec != "flat" and ann.RERANK_FACTOR else k
+        with trace.span("search", ann.backend_of(index), k=k, ntotal=index.ntotal, filtered=bool(filters), codec=codec) as t:
+            # Metadata filters (e.g. {"source": "agency-x"}) and deletions not yet compacted out of a snapshot:
+            # over-fetch, widening until enough survive or the corpus is exhausted
+            fetch = want if allowed is None and not deleted else want * 8
+            while True:
+                D, I = index.search(qv, min(fetch, index.ntotal))
+                ids = [int(i) for i in I[0] if keep(int(i))]
+                if len(ids) >= want or fetch >= index.ntotal:
+                    t["fetched"] = min(fetch, index.ntotal)
+                    break
+                fetch *= 4
+            if want > k:
+                return qv[0], ann.rerank(_vectors(), qv[0], ids[:want], k)
+            return qv[0], ids[:k]
+
+def _lexical(q: str, k: int, filters: Dict = None, allowed: Optional[set] = None) -> List[int]:
+    with _lock:
+        _, rows = _resident()
+        if allowed is None and filters:
+            allowed = _allowed(filters, rows)
+        allow = allowed.__contains__ if allowed is not None else None
+        # Under the lock: postings are appended in place by _read_tail
+        with trace.span("search", "bm25", k=k, ntotal=len(_state["bm25"]), filtered=bool(filters)):
+            return [i for i, _ in _state["bm25"].search(q, k, allow)]
+
+def _search(q: str, k: int, filters: Dict = None, mode: str = None):
+    # -> (unit query vector or None for lexical, row ids best-first)
+    mode = mode or RETRIEVAL_MODE
+    index, rows = _resident()
     if index is None:
-        return []
-    qv = np.array(embed(q)[0], dtype="float32")
-    faiss.normalize_L2(qv.reshape(1,-1))
-    D, I = index.search(qv.reshape(1,-1), k)
-    return [meta[i] for i in I[0] if i < len(meta)]
+        return None, []
+    allowed = _allowed(filters, rows)
+    if mode == "lexical":
+        return None, _lexical(q, k, filters, allowed)
+    if mode == "dense":
+        return _dense(q, k, filters, allowed)
+    # Hybrid: exact names and figures come from BM25, paraphrases from vectors; fuse by rank
+    fetch = max(k * 4, 20)
+    lexical = _lexical(q, fetch, filters, allowed)
+    try:
+        qv, dense = _dense(q, fetch, filters, allowed)
+    except RuntimeError:
+        # Embeddings API down or throttled past its retries: BM25 alone still answers
+        return None, lexical[:k]
+    return qv, rrf([dense, lexical], k)
+
+def query(q: str, k=6, filters: Dict = None, mode: str = None):
+    _, ids = _search(q, k, filters, mode)
+    recs = store.get(ids)
+    return [recs[i] for i in ids if i in recs]
+
+def _mmr(rel, vecs, costs: List[int], budget: int, lam: float) -> List[int]:
+    # Greedy maximal marginal relevance, skipping candidates that no longer fit the token budget
+    import numpy as np
+    redundancy = np.zeros(len(vecs), dtype="float32")
+    open_ = np.ones(len(vecs), dtype=bool)
+    chosen, used = [], 0
+    while open_.any():
+        score = np.where(open_, lam * rel - (1.0 - lam) * redundancy, -np.inf)
+        j = int(np.argmax(score))
+        open_[j] = False
+        if used + costs[j] > budget:
+            continue
+        chosen.append(j)
+        used += costs[j]
+        redundancy = np.maximum(redundancy, vecs @ vecs[j])
+    return chosen
+
+def _merge_overlap(a: str, b: str) -> str:
+    # Consecutive chunks repeat the previous chunk's trailing paragraphs; keep them once
+    pa, pb = a.split("\n\n"), b.split("\n\n")
+    for j in range(min(len(pa), len(pb)), 0, -1):
+        if pa[-j:] == pb[:j]:
+            return "\n\n".join(pa + pb[j:])
+    return a + "\n\n" + b
+
+def _pages_label(first, last) -> str:
+    if first is None:
+        return ""
+    return f", p. {first}" if last in (None, first) else f", pp. {first}-{last}"
+
+def build_context(q: str, budget: int = CONTEXT_TOKENS, filters: Dict = None,
+                  candidates: int = CONTEXT_CANDIDATES, lam: float = MMR_LAMBDA, mode: str = None) -> Dict:
+    """Pack the most relevant, least redundant chunks for q into about `budget` tokens.
+
+    Returns {"text", "sources", "tokens", "candidates"}; text holds numbered blocks
+    ("[1] report.pdf, p. 3") whose numbers index into sources.
+    """
+    import numpy as np
+    t0 = time.perf_counter()
+    mode = mode or RETRIEVAL_MODE
+    qv, ids = _search(q, candidates, filters, mode)
+    if not ids:
+        return {"text": "", "sources": [], "tokens": 0, "candidates": 0}
+    meta = store.get(ids)   # only the candidates' rows are read
+    ids = [i for i in ids if i in meta]
+    vecs = np.asarray(resident_vectors()[ids], dtype="float32")
+    costs = [meta[i].get("tokens") or count_tokens(meta[i]["text"]) for i in ids]
+    # Fused and lexical rankings have no cosine scale: relevance decays with rank over the same 1..0.5 span
+    rel = vecs @ qv if mode == "dense" and qv is not None else 1.0 - 0.5 * np.arange(len(ids), dtype="float32") / len(ids)
+    picked = [ids[j] for j in _mmr(rel, vecs, costs, budget, lam)]
+
+    # Runs of consecutive picked rows from the same file are neighbouring chunks: merge them in reading order
+    rank = {i: r for r, i in enumerate(picked)}
+    groups: List[List[int]] = []
+    for i in sorted(picked):
+        if groups and groups[-1][-1] == i - 1 and meta[i - 1].get("filename") == meta[i].get("filename"):
+            groups[-1].append(i)
+        else:
+            groups.append([i])
+    groups.sort(key=lambda g: min(rank[i] for i in g))   # most relevant block first
+
+    blocks, sources = [], []
+    for n, g in enumerate(groups, 1):
+        text = meta[g[0]]["text"]
+        for i in g[1:]:
+            text = _merge_overlap(text, meta[i]["text"])
+        first, last = meta[g[0]].get("page"), meta[g[-1]].get("page")
+        src = {"ref": n, "filename": meta[g[0]].get("filename", "unknown"), "source": meta[g[0]].get("source"),
+               "page": first, "last_page": last, "chunks": len(g)}
+        blocks.append(f"[{n}] {src['filename']}{_pages_label(first, last)}\n{text}")
+        sources.append(src)
+    text = "\n\n".join(blocks)
+    tokens = count_tokens(text)
+    trace.record("context", mode, ms=round(1000.0 * (time.perf_counter() - t0), 2), budget=budget, tokens=tokens,
+                 candidates=len(ids), picked=len(picked), blocks=len(blocks), ok=True)
+    return {"text": text, "sources": sources, "tokens": tokens, "candidates": len(ids)}
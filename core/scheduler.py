@@ -0,0 +1,176 @@
+import json, time, heapq, itertools, threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+from core import config
+
+# Process-wide admission control for API calls. Every Streamlit session and batch thread draws from one
+# pair of token buckets per model (requests and tokens per minute), queueing by priority class, so a
+# workshop full of ingests waits its turn behind interactive drafting instead of tripping 429s.
+INTERACTIVE, BACKGROUND, BULK = 0, 1, 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background", BULK: "bulk"}
+
+SCHED_ENABLED = str(config.get("SCHED_ENABLED", "1")).lower() not in ("0", "false", "no")
+SCHED_BURST_S = float(config.get("SCHED_BURST_S", 10))       # bucket depth, in seconds of the per-minute rate
+SCHED_HEADROOM = float(config.get("SCHED_HEADROOM", 0.9))    # share of the org limit this process may use
+SCHED_BURST_MAX = float(config.get("SCHED_BURST_MAX", 5))    # burst floor for low per-minute limits (e.g. image rpm)
+
+# Requests / tokens per minute (tier-1 defaults); override with RATE_LIMITS as JSON. A missing key means unlimited.
+RATE_LIMITS = {
+    "gpt-4o-mini": {"rpm": 500, "tpm": 200000},
+    "gpt-4o": {"rpm": 500, "tpm": 30000},
+    "gpt-4.1-mini": {"rpm": 500, "tpm": 200000},
+    "gpt-4.1": {"rpm": 500, "tpm": 30000},
+    "text-embedding-3-small": {"rpm": 3000, "tpm": 1000000},
+    "text-embedding-3-large": {"rpm": 3000, "tpm": 1000000},
+    "gpt-image-1": {"rpm": 5},
+}
+RATE_LIMITS.update(json.loads(config.get("RATE_LIMITS", "{}") or "{}"))
+DEFAULT_LIMITS = {"rpm": 500, "tpm": 200000}
+
+_priority: ContextVar[Optional[int]] = ContextVar("sched_priority", default=None)
+_cond = threading.Condition()
+_seq = itertools.count()
+
+class _Bucket:
+    def __init__(self, per_minute: float):
+        self.rate = per_minute * SCHED_HEADROOM / 60.0
+        # A few seconds of a low limit is under one request; let such buckets hold up to a minute's allowance
+        self.capacity = max(1.0, self.rate * SCHED_BURST_S, min(per_minute * SCHED_HEADROOM, SCHED_BURST_MAX))
+        self.level = self.capacity
+        self.t = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.t) * self.rate)
+        self.t = now
+
+    def wait_for(self, n: float, now: float) -> float:
+        # Requests larger than the bucket go through once it is full and leave it in debt
+        self._refill(now)
+        short = min(n, self.capacity) - self.level
+        return short / self.rate if short > 0 else 0.0
+
+    def take(self, n: float):
+        self.level -= n
+
+    def give(self, n: float):
+        self.level = min(self.capacity, self.level + n)
+
+class _Limiter:
+    def __init__(self, limits: Dict):
+        self.limits = dict(limits)
+        self.requests = _Bucket(limits["rpm"]) if limits.get("rpm") else None
+        self.tokens = _Bucket(limits["tpm"]) if limits.get("tpm") else None
+        self.waiting: List = []          # heap of (priority, seq)
+        self.paused_until = 0.0
+        self.granted = {p: 0 for p in PRIORITY_NAMES}
+        self.wait_s = {p: 0.0 for p in PRIORITY_NAMES}
+        self.max_wait_s = 0.0
+        self.throttled = 0
+
+    def wait_for(self, tokens: int, now: float) -> float:
+        waits = [self.paused_until - now]
+        if self.requests:
+            waits.append(self.requests.wait_for(1, now))
+        if self.tokens and tokens:
+            waits.append(self.tokens.wait_for(tokens, now))
+        return max(waits)
+
+_limiters: Dict[str, _Limiter] = {}
+
+def _limiter(model: str) -> _Limiter:
+    lim = _limiters.get(model)
+    if lim is None:
+        lim = _limiters[model] = _Limiter(RATE_LIMITS.get(model, DEFAULT_LIMITS))
+    return lim
+
+def demote(level: int):
+    # Lower the priority of every call from the current context, e.g. a headless batch submission thread
+    _priority.set(max(level, _priority.get() or INTERACTIVE))
+
+@contextmanager
+def priority(level: int) -> Iterator[None]:
+    # Scoped demote(): calls made inside the block, including pools fed through trace.propagate
+    token = _priority.set(max(level, _priority.get() or INTERACTIVE))
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def acquire(model: str, tokens: int = 0, level: int = INTERACTIVE) -> Dict:
+    """Block until `model` has room for one request of `tokens`; returns queue_ms / queue_depth for tracing.
+
+    Per model, the highest-priority (then oldest) waiter is served first; others wait behind it."""
+    if not SCHED_ENABLED:
+        return {"queue_ms": 0.0, "queue_depth": 0}
+    level = max(level, _priority.get() or INTERACTIVE)   # a context can only lower priority
+    t0 = time.monotonic()
+    with _cond:
+        lim = _limiter(model)
+        ticket = (level, next(_seq))
+        heapq.heappush(lim.waiting, ticket)
+        depth = len(lim.waiting) - 1
+        _cond.notify_all()   # a more urgent arrival re-sorts the queue
+        try:
+            while True:
+                now = time.monotonic()
+                if lim.waiting[0] != ticket:
+                    _cond.wait()
+                    continue
+                wait = lim.wait_for(tokens, now)
+                if wait <= 0:
+                    break
+                _cond.wait(wait)
+            if lim.requests:
+                lim.requests.take(1)
+            if lim.tokens and tokens:
+                lim.tokens.take(tokens)
+        finally:
+            lim.waiting.remove(ticket)
+            heapq.heapify(lim.waiting)
+            _cond.notify_all()
+        waited = now - t0
+        lim.granted[level] += 1
+        lim.wait_s[level] += waited
+        lim.max_wait_s = max(lim.max_wait_s, waited)
+    return {"queue_ms": round(1000.0 * waited, 2), "queue_depth": depth}
+
+def settle(model: str, reserved: int, actual: Optional[int]):
+    # Reconcile an estimate with the usage the API reported
+    if not SCHED_ENABLED or actual is None or actual == reserved:
+        return
+    with _cond:
+        lim = _limiter(model)
+        if lim.tokens:
+            if actual < reserved:
+                lim.tokens.give(reserved - actual)
+            else:
+                lim.tokens.take(actual - reserved)
+        _cond.notify_all()
+
+def backoff(model: str, seconds: float):
+    # A 429 pauses the whole model, not just the caller that saw it
+    with _cond:
+        lim = _limiter(model)
+        lim.paused_until = max(lim.paused_until, time.monotonic() + seconds)
+        lim.throttled += 1
+
+def stats() -> Dict[str, Dict]:
+    now = time.monotonic()
+    out = {}
+    with _cond:
+        for model, lim in _limiters.items():
+            queued = [p for p, _ in lim.waiting]
+            granted = sum(lim.granted.values())
+            out[model] = {
+                **{k: lim.limits.get(k) for k in ("rpm", "tpm")},
+                "queued": len(queued),
+                **{f"queued {name}": queued.count(p) for p, name in PRIORITY_NAMES.items()},
+                "granted": granted,
+                **{f"avg wait ms {name}": round(1000.0 * lim.wait_s[p] / lim.granted[p], 1) if lim.granted[p] else None
+                   for p, name in PRIORITY_NAMES.items()},
+                "max wait ms": round(1000.0 * lim.max_wait_s, 1),
+                "throttled": lim.throttled,
+                "paused s": round(max(0.0, lim.paused_until - now), 1),
+            }
+    return out
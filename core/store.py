@@ -0,0 +1,178 @@
+import os, json, sqlite3, threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from core.cache import _connect, _SQL_BATCH
+
+STORE_PATH = os.path.join("data", "chunks.sqlite")
+
+# Filterable metadata gets its own indexed column; any other record keys ride along in "extra"
+COLUMNS = ("filename", "source", "digest", "page")
+_BUILTIN = ("text", "tokens", "simhash") + COLUMNS
+
+def _signed(h: Optional[int]) -> Optional[int]:
+    # SimHashes are unsigned 64-bit; SQLite integers are signed
+    return h - (1 << 64) if h is not None and h >= 1 << 63 else h
+
+def _unsigned(h: Optional[int]) -> Optional[int]:
+    return h + (1 << 64) if h is not None and h < 0 else h
+
+
+class ChunkStore:
+    """Chunk text and metadata keyed by vector id (row i of vectors.f32 is chunk id i).
+
+    Rows are only ever read below a caller-supplied bound (the committed row count), so ids a
+    crashed writer left behind stay invisible until the next put() overwrites them."""
+
+    def __init__(self, path: str = STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = _connect(self.path)
+            conn.execute("PRAGMA synchronous=FULL")   # the index header vouches for these rows once written
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                " id INTEGER PRIMARY KEY, filename TEXT, source TEXT, digest TEXT, page INTEGER,"
+                " tokens INTEGER, simhash INTEGER, text TEXT NOT NULL, extra TEXT,"
+                " deleted INTEGER NOT NULL DEFAULT 0)"
+            )
+            for col in ("filename", "source", "digest"):
+                conn.execute(f"CREATE INDEX IF NOT EXISTS chunks_{col} ON chunks({col})")
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _row(rec: Dict) -> Tuple:
+        extra = {k: v for k, v in rec.items() if k not in _BUILTIN}
+        return (rec.get("filename"), rec.get("source"), rec.get("digest"), rec.get("page"), rec.get("tokens"),
+                _signed(rec.get("simhash")), rec["text"], json.dumps(extra, ensure_ascii=False) if extra else None)
+
+    @staticmethod
+    def _record(row) -> Dict:
+        # Same shape the chunk had when it was indexed: {"text", <meta>, "simhash", "tokens"[, "page"]}
+        filename, source, digest, page, tokens, simhash, text, extra = row
+        rec = {"text": text}
+        rec.update((k, v) for k, v in (("filename", filename), ("source", source), ("digest", digest)) if v is not None)
+        if extra:
+            rec.update(json.loads(extra))
+        if simhash is not None:
+            rec["simhash"] = _unsigned(simhash)
+        if tokens is not None:
+            rec["tokens"] = tokens
+        if page is not None:
+            rec["page"] = page
+        return rec
+
+    @staticmethod
+    def _where(filters: Dict, below: int) -> Tuple[str, List, Dict]:
+        # -> (SQL condition, args, filters left for Python); list/tuple/set values mean "any of"
+        clauses, args, rest = ["deleted = 0", "id < ?"], [below], {}
+        for k, v in (filters or {}).items():
+            if k not in COLUMNS:
+                rest[k] = v
+            elif isinstance(v, (list, tuple, set)):
+                v = list(v)
+                clauses.append(f"{k} IN ({','.join('?' * len(v))})")
+                args.extend(v)
+            else:
+                clauses.append(f"{k} IS ?")
+                args.append(v)
+        return " AND ".join(clauses), args, rest
+
+    @staticmethod
+    def _matches(rec: Dict, filters: Dict) -> bool:
+        return all(rec.get(k) == v or (isinstance(v, (list, tuple, set)) and rec.get(k) in v)
+                   for k, v in filters.items())
+
+    _FIELDS = "filename, source, digest, page, tokens, simhash, text, extra"
+
+    def put(self, first_id: int, records: List[Dict]):
+        # One transaction; replaces anything a crashed writer left at or past first_id
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN")
+            try:
+                db.execute("DELETE FROM chunks WHERE id >= ?", (first_id,))
+                db.executemany(f"INSERT INTO chunks (id, {self._FIELDS}) VALUES (?,?,?,?,?,?,?,?,?)",
+                               [(first_id + i, *self._row(r)) for i, r in enumerate(records)])
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def get(self, ids: Iterable[int]) -> Dict[int, Dict]:
+        ids = list(dict.fromkeys(int(i) for i in ids))
+        out: Dict[int, Dict] = {}
+        with self._lock:
+            db = self._db()
+            for i in range(0, len(ids), _SQL_BATCH):
+                part = ids[i : i + _SQL_BATCH]
+                marks = ",".join("?" * len(part))
+                for row in db.execute(f"SELECT id, {self._FIELDS} FROM chunks WHERE id IN ({marks})", part):
+                    out[row[0]] = self._record(row[1:])
+        return out
+
+    def find(self, filters: Dict, below: int) -> List[Tuple[int, Dict]]:
+        # -> [(id, record)] in ingestion order
+        cond, args, rest = self._where(filters, below)
+        with self._lock:
+            rows = self._db().execute(f"SELECT id, {self._FIELDS} FROM chunks WHERE {cond} ORDER BY id", args).fetchall()
+        found = [(r[0], self._record(r[1:])) for r in rows]
+        return [(i, rec) for i, rec in found if self._matches(rec, rest)] if rest else found
+
+    def ids(self, filters: Dict, below: int) -> List[int]:
+        cond, args, rest = self._where(filters, below)
+        if rest:
+            return [i for i, _ in self.find(filters, below)]
+        with self._lock:
+            return [r[0] for r in self._db().execute(f"SELECT id FROM chunks WHERE {cond} ORDER BY id", args)]
+
+    def scan(self, start: int, stop: int, batch: int = 2000) -> Iterator[Tuple[int, Optional[str], Optional[int]]]:
+        # -> (id, text or None if deleted, simhash) for start <= id < stop, streamed in batches
+        while start < stop:
+            with self._lock:
+                rows = self._db().execute(
+                    "SELECT id, CASE WHEN deleted THEN NULL ELSE text END, simhash FROM chunks"
+                    " WHERE id >= ? AND id < ? ORDER BY id LIMIT ?", (start, stop, batch)).fetchall()
+            if not rows:
+                return
+            for i, text, simhash in rows:
+                yield i, text, _unsigned(simhash)
+            start = rows[-1][0] + 1
+
+    def delete(self, filters: Dict, below: int) -> List[Dict]:
+        # Tombstones the matching chunks; -> [{"digest", "filename", "chunks"}] per document removed
+        if not filters:
+            raise ValueError("delete() needs at least one filter")
+        ids = self.ids(filters, below)
+        if not ids:
+            return []
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN")
+            try:
+                docs: Dict[Tuple, int] = {}
+                for i in range(0, len(ids), _SQL_BATCH):
+                    part = ids[i : i + _SQL_BATCH]
+                    marks = ",".join("?" * len(part))
+                    for digest, filename in db.execute(f"SELECT digest, filename FROM chunks WHERE id IN ({marks})", part):
+                        docs[(digest, filename)] = docs.get((digest, filename), 0) + 1
+                    db.execute(f"UPDATE chunks SET deleted = 1 WHERE id IN ({marks})", part)
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return [{"digest": d, "filename": f, "chunks": n} for (d, f), n in docs.items()]
+
+    def deleted(self, below: int) -> List[int]:
+        with self._lock:
+            return [r[0] for r in self._db().execute("SELECT id FROM chunks WHERE deleted = 1 AND id < ? ORDER BY id", (below,))]
+
+    def live_digests(self, digests: Iterable[str], below: int) -> set:
+        digests = [d for d in digests if d]
+        if not digests:
+            return set()
+        cond, args, _ = self._where({"digest": digests}, below)
+        with self._lock:
+            return {r[0] for r in self._db().execute(f"SELECT DISTINCT digest FROM chunks WHERE {cond}", args)}
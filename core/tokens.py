@@ -0,0 +1,41 @@
+import re
+from functools import lru_cache
+from typing import List
+
+# tiktoken downloads its BPE tables on first use; offline hosts fall back to a word/punctuation split,
+# which over-counts slightly compared to the real encoder and so stays on the safe side of limits
+_FALLBACK_RE = re.compile(r"\w+|[^\w\s]|\s+")
+
+
+class _ApproxEncoding:
+    name = "approx"
+
+    def encode(self, text: str, **_) -> List[str]:
+        return _FALLBACK_RE.findall(text)
+
+    def decode(self, toks: List[str]) -> str:
+        return "".join(toks)
+
+
+@lru_cache(maxsize=8)
+def encoding_for(model: str = "text-embedding-3-small"):
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return _ApproxEncoding()
+
+
+def encode(text: str, model: str = "text-embedding-3-small"):
+    return encoding_for(model).encode(text, disallowed_special=())
+
+
+def decode(toks, model: str = "text-embedding-3-small") -> str:
+    return encoding_for(model).decode(toks)
+
+
+def count_tokens(text: str, model: str = "text-embedding-3-small") -> int:
+    return len(encode(text, model))
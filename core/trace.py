@@ -0,0 +1,118 @@
+import os, json, time, threading
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from typing import Dict, Iterator, List, Optional
+from core import config
+
+# One JSON line per traced call (chat, embed, image, extract, chunk, search, ...) and per pipeline step.
+# The active session/step ride on context variables; worker pools hand them on via propagate().
+TRACE_ENABLED = str(config.get("TRACE_ENABLED", "1")).lower() not in ("0", "false", "no")
+TRACE_DIR     = os.path.join("data", "traces")
+TRACE_PATH    = os.path.join(TRACE_DIR, "trace.jsonl")
+TRACE_MAX_MB  = float(config.get("TRACE_MAX_MB", 20))
+TRACE_BACKUPS = int(config.get("TRACE_BACKUPS", 5))
+
+# Estimated USD per 1M tokens (input, output), or per image by size; override with TRACE_PRICES as JSON
+PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+    "text-embedding-3-small": (0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.0),
+    "gpt-image-1": {"1024x1024": 0.042, "1536x1024": 0.063, "1024x1536": 0.063},
+}
+PRICES.update(json.loads(config.get("TRACE_PRICES", "{}") or "{}"))
+
+_session: ContextVar[Optional[str]] = ContextVar("trace_session", default=None)
+_step: ContextVar[Optional[str]] = ContextVar("trace_step", default=None)
+_write_lock = threading.Lock()
+
+def bind(session: Optional[str] = None, step: Optional[str] = None):
+    # Tag every record emitted from the current context (a Streamlit script run, a batch submission thread)
+    if session is not None:
+        _session.set(session)
+    if step is not None:
+        _step.set(step)
+
+def propagate(fn):
+    # ThreadPoolExecutor does not copy context variables: pool.submit(propagate(fn), ...)
+    ctx = copy_context()
+    return lambda *a, **kw: ctx.copy().run(fn, *a, **kw)
+
+def cost(model: str, tokens_in: int = 0, tokens_out: int = 0, images: int = 0, size: str = "") -> Optional[float]:
+    price = PRICES.get(model)
+    if price is None:
+        return None
+    if isinstance(price, dict):
+        return images * price.get(size, max(price.values()))
+    return (tokens_in * price[0] + tokens_out * price[1]) / 1e6
+
+def _rotate():
+    for i in range(TRACE_BACKUPS - 1, 0, -1):
+        if os.path.exists(f"{TRACE_PATH}.{i}"):
+            os.replace(f"{TRACE_PATH}.{i}", f"{TRACE_PATH}.{i + 1}")
+    os.replace(TRACE_PATH, f"{TRACE_PATH}.1")
+
+def record(kind: str, name: str = "", **fields):
+    if not TRACE_ENABLED:
+        return
+    rec = {"ts": round(time.time(), 3), "kind": kind, "name": name,
+           "session": _session.get(), "step": _step.get(), **fields}
+    line = json.dumps(rec, ensure_ascii=False, default=str) + "\n"
+    with _write_lock:
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        try:
+            if os.path.getsize(TRACE_PATH) + len(line) > TRACE_MAX_MB * 1024 * 1024:
+                _rotate()
+        except FileNotFoundError:
+            pass
+        with open(TRACE_PATH, "a", encoding="utf-8") as f:
+            f.write(line)
+
+@contextmanager
+def span(kind: str, name: str = "", **fields) -> Iterator[Dict]:
+    """Time a block and record it; callers add tokens, bytes, retries, cache hits... to the yielded dict."""
+    rec = dict(fields)
+    t0 = time.perf_counter()
+    try:
+        yield rec
+        rec.setdefault("ok", True)
+    except GeneratorExit:
+        # A streamed reply abandoned by its consumer
+        rec.update(ok=True, cancelled=True)
+        raise
+    except BaseException as e:
+        rec.update(ok=False, error=f"{type(e).__name__}: {str(e)[:200]}")
+        raise
+    finally:
+        rec["ms"] = round(1000.0 * (time.perf_counter() - t0), 2)
+        record(kind, name, **rec)
+
+@contextmanager
+def step(name: str, **fields) -> Iterator[Dict]:
+    # A pipeline step (analyze, draft, visuals, ...): tags nested records and records its own wall time
+    token = _step.set(name)
+    try:
+        with span("step", name, **fields) as rec:
+            yield rec
+    finally:
+        _step.reset(token)
+
+def load(since: Optional[float] = None) -> List[Dict]:
+    # Oldest first across the rotated files; partial or corrupt lines are skipped
+    out: List[Dict] = []
+    paths = [f"{TRACE_PATH}.{i}" for i in range(TRACE_BACKUPS, 0, -1)] + [TRACE_PATH]
+    for p in paths:
+        try:
+            with open(p, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue
+                    if since is None or rec.get("ts", 0) >= since:
+                        out.append(rec)
+        except FileNotFoundError:
+            continue
+    return out
@@ -1,8 +1,8 @@
-import re
+import re, json
 
 CASE_TEMPLATE = """# {title}
 
-**Executive Summary**  
+## Executive Summary
 {summary}
 
 ## Problem / Need
@@ -30,3 +30,14 @@ def build_case_study(title, summary, problem, implementation, benefits, learning
 def parse_questions_list(text: str):
     items = re.findall(r"[-•]\s*(.+)", text)
     return [i.strip() for i in items[:10]] or [text.strip()[:120]]
+
+def parse_bullet_lines(text: str):
+    # One entry per non-empty line, bullet markers stripped
+    return [line.strip("-• ").strip() for line in text.splitlines() if line.strip()]
+
+def parse_json_object(text: str) -> dict:
+    # First {...} span in a model reply, tolerating prose or code fences around it
+    m = re.search(r"\{.*\}", text or "", re.S)
+    if not m:
+        raise ValueError("model did not return a JSON object")
+    return json.loads(m.group(0))
@@ -1,8 +1,8 @@
 import streamlit as st
 from core.auth import require_password
-from core.rag import extract_text, upsert_documents, query
-from core.llm import chat
-from core.utils import parse_questions_list
+from core.rag import ingest_files, chunks_for_upload, indexed_documents, remove_document
+from core.analysis import analyze
+from core import trace
 
 st.set_page_config(page_title="Upload & Analyze", page_icon="📤", layout="wide")
 require_password()
@@ -11,26 +11,59 @@ st.title("📤 Step 1 — Upload & Analyze")
 
 uploads = st.file_uploader("Upload files (PDF/DOCX/TXT)", type=["pdf","docx","txt","md"], accept_multiple_files=True)
 if st.button("Ingest & Analyze") and uploads:
-    texts = []
-    for f in uploads:
-        t = extract_text(f.read(), f.name)
-        texts.append(t)
-        upsert_documents([{"text": t, "meta": {"filename": f.name, "source": "user_upload"}}])
-    st.success("✅ Ingested & indexed.")
+    bar = st.progress(0.0)
+    def _progress(done, total):
+        bar.progress(min(done / total, 1.0) if total else 1.0, text=f"Embedding: {done}/{total} chunks")
+    with trace.step("ingest", files=len(uploads)):
+        summary = ingest_files([(f.name, f.getvalue()) for f in uploads], progress=_progress)
+    bar.empty()
+    if summary["files"]:
+        st.success(f"✅ Ingested & indexed {summary['chunks']} chunks from {len(summary['files'])} new file(s) "
+                   f"in {summary['seconds']:.1f}s ({summary['chunks_per_s']:.1f} chunks/s, {summary['mb_per_s']:.2f} MB/s).")
+    if summary["skipped"]:
+        st.info("ℹ️ Already indexed, skipped: " + ", ".join(
+            s["filename"] + (f" (as {s['indexed_as']})" if s["indexed_as"] != s["filename"] else "")
+            for s in summary["skipped"]))
+    for r in summary["files"]:
+        if r["errors"]:
+            st.warning(f"⚠️ {r['filename']}: " + "; ".join(r["errors"][:5]) + (" …" if len(r["errors"]) > 5 else ""))
+    with st.expander("Ingestion summary"):
+        st.dataframe([{"file": r["filename"], "pages": r["pages"], "chunks": r["chunks"],
+                       "duplicates dropped": r["duplicates_dropped"], "MB": round(r["bytes"] / 1e6, 2),
+                       "extract s": round(r["seconds"], 2), "chunk s": round(r["chunk_seconds"], 2),
+                       "parallel": r["parallel"], "errors": len(r["errors"])}
+                      for r in summary["files"]], hide_index=True)
+        st.caption(f"Extraction {summary['extract_seconds']:.1f}s · embedding + commit {summary['embed_commit_seconds']:.1f}s")
 
-    corpus_sample = "\n\n".join([t[:1500] for t in texts])[:4000]
-    prompt = f"""You are assisting to prepare a public-sector finance **case study**.
-    Based on the following uploaded content (may be partial), list the **missing information** that we must ask the user **as bullet questions**.
-    Cover: title direction, executive summary angle, problem clarity, implementation specifics (timeline, roles, tools), benefits with metrics, learning points, and a POC contact.
-    Content sample:
-    ---
-    {corpus_sample}
-    ---
-    Return only bullet questions (can be 0, max 3).
-    """
-    qs = chat([{"role":"user","content":prompt}])
+    bar = st.progress(0.0)
+    def _analysis_progress(done, total):
+        bar.progress(done / total, text=f"Reviewing material: {done}/{total} excerpts")
+    with trace.step("analyze"):
+        result = analyze(chunks_for_upload(summary), progress=_analysis_progress)
+    bar.empty()
+    qs = result["questions_text"]
     st.session_state["missing_questions_text"] = qs
-    st.session_state["missing_questions"] = parse_questions_list(qs)
-    st.success("🔎 Analysis complete. Proceed to **2️⃣ Fill Missing Info**.")
+    st.session_state["missing_questions"] = result["questions"]
+    st.success(f"🔎 Analysis complete ({result['excerpts']} excerpts reviewed in {result['seconds']:.1f}s). "
+               "Proceed to **2️⃣ Fill Missing Info**.")
+    if result["failed"]:
+        st.warning(f"⚠️ {len(result['failed'])} excerpt(s) could not be reviewed: {result['failed'][0]}")
+    with st.expander("Coverage by section"):
+        for section, facts in result["coverage"].items():
+            st.markdown(f"**{section}** — " + (f"{len(facts)} fact(s)" if facts else "_nothing found_"))
+            for fact in facts:
+                st.markdown(f"- {fact}")
     with st.expander("See suggested questions"):
         st.markdown(qs)
+
+with st.expander("Indexed documents"):
+    docs = indexed_documents()
+    if not docs:
+        st.caption("Nothing indexed yet.")
+    for d in docs:
+        c1, c2 = st.columns([5, 1])
+        c1.markdown(f"**{d['filename']}** · {d.get('chunks', 0)} chunks · {d.get('ingested_at') or ''}")
+        if c2.button("Remove", key=f"rm-{d['digest']}"):
+            removed = remove_document(d["digest"])
+            st.toast(f"Removed {sum(r['chunks'] for r in removed)} chunks of {d['filename']}")
+            st.rerun()
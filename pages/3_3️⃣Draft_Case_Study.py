@@ -1,8 +1,10 @@
 import streamlit as st
 from core.auth import require_password
-from core.rag import query
-from core.llm import chat
-from core.utils import build_case_study
+from core.rag import build_context
+from core.llm import chat_stream
+from core.prompts import draft_prompt, answers_text, CASE_FIELDS, SECTION_SPECS
+from core.drafting import draft_sections, draft_section, assemble
+from core import trace
 
 st.set_page_config(page_title="Draft Case Study", page_icon="📄", layout="wide")
 require_password()
@@ -15,32 +17,59 @@ if not answers:
     st.stop()
 
 topic_hint = st.text_input("Optional: topic hint for better grounding (e.g., 'budget consolidation, procurement chatbot')", value="finance transformation, case study")
+fresh = st.checkbox("Regenerate (ignore cached draft)", value=False)
+mode = st.radio("Drafting mode", ["Section by section (parallel)", "Single pass (streaming)"], horizontal=True)
 if st.button("Draft Now"):
-    ctx = query(topic_hint, k=8)
-    base = "\n\n".join([c["text"] for c in ctx]) if ctx else "(no context)"
-    answers_text = "\n".join([f"- {k}: {v}" for k,v in answers.items() if v.strip()])
+    if mode.startswith("Single"):
+        ctx = build_context(topic_hint)
+        base = ctx["text"] or "(no context)"
+        if ctx["sources"]:
+            with st.expander(f"Grounding: {len(ctx['sources'])} excerpts, ~{ctx['tokens']} tokens"):
+                for s in ctx["sources"]:
+                    pages = "" if s["page"] is None else f" — p. {s['page']}" + (f"–{s['last_page']}" if s["last_page"] not in (None, s["page"]) else "")
+                    st.markdown(f"**[{s['ref']}]** {s['filename']}{pages}")
+        prompt = draft_prompt(base, answers_text(answers))
+        with trace.step("draft", mode="single"):
+            draft = st.write_stream(chat_stream([{"role":"user","content":prompt}], cache=not fresh))
+        st.session_state["case_markdown"] = draft
+        st.session_state.pop("draft_sections", None)
+        st.success("✅ Draft ready. Proceed to **4️⃣ Generate Visuals**.")
+    else:
+        # Placeholders in template order; each section fills in as soon as its own call returns
+        slots = {f: st.empty() for f in CASE_FIELDS}
+        for f in CASE_FIELDS:
+            slots[f].info(f"⏳ Drafting: *{SECTION_SPECS[f]['label']}* …")
+        sections, failed = {}, []
+        with trace.step("draft", mode="sections"):
+            for field, text, err, seconds in draft_sections(topic_hint, answers, fresh=fresh):
+                label = SECTION_SPECS[field]["label"]
+                if err is not None:
+                    failed.append(label)
+                    slots[field].error(f"Failed to draft '{label}': {err}")
+                    continue
+                sections[field] = text
+                slots[field].markdown(f"**{label}** · {seconds:.1f}s\n\n{text}")
+        st.session_state["draft_sections"] = sections
+        st.session_state["draft_topic"] = topic_hint
+        st.session_state["case_markdown"] = assemble(sections)
+        if failed:
+            st.warning("⚠️ Some sections failed: " + ", ".join(failed) + ". Regenerate them below.")
+        else:
+            st.success("✅ Draft ready. Proceed to **4️⃣ Generate Visuals**.")
 
-    prompt = f"""You are a professional case study writer for public-sector finance.
-    Using the CONTEXT (from uploaded files) and the USER ANSWERS (provided via a form), draft a polished, visually engaging case study with the following sections:
-
-    1) Captivating Title
-    2) Executive Summary (3–5 sentences)
-    3) Problem / Need for the project
-    4) Implementation Approach (timeline, roles, tools, governance)
-    5) Benefits & Impact (quantify where possible, use bullets if helpful)
-    6) Key Learning Points (bulleted)
-    7) Point of Contact (POC: name, role, email — use placeholders if missing)
-    8) Suggested Visuals/Diagrams (list 2–3 ideas)
-
-    CONTEXT:
-    {base}
-
-    USER ANSWERS:
-    {answers_text}
-
-    Return **Markdown only**.
-    """
-    draft = chat([{"role":"user","content":prompt}])
-    st.session_state["case_markdown"] = draft
-    st.success("✅ Draft ready. See below and proceed to **4️⃣ Generate Visuals**.")
-    st.markdown(draft)
+sections = st.session_state.get("draft_sections")
+if sections is not None:
+    st.divider()
+    st.subheader("Regenerate one section")
+    field = st.selectbox("Section", CASE_FIELDS, format_func=lambda f: SECTION_SPECS[f]["label"])
+    if st.button("Regenerate Section"):
+        with st.spinner(f"Redrafting {SECTION_SPECS[field]['label']}…"):
+            try:
+                with trace.step("redraft", section=field):
+                    sections[field] = draft_section(field, st.session_state.get("draft_topic", topic_hint), answers, fresh=True)
+                st.session_state["case_markdown"] = assemble(sections)
+                st.success(f"✅ {SECTION_SPECS[field]['label']} updated.")
+            except Exception as e:
+                st.error(f"Failed to draft '{SECTION_SPECS[field]['label']}': {e}")
+    with st.expander("Current draft"):
+        st.markdown(st.session_state["case_markdown"])
@@ -1,6 +1,10 @@
 import streamlit as st
 from core.auth import require_password
-from core.llm import chat, generate_image
+from core.llm import chat_stream, generate_images
+from core import images, trace
+from core.utils import parse_bullet_lines
+from core.prompts import diagram_prompts_prompt, cover_image_prompt, diagram_image_prompt
+from core.export import COVER_KEY
 import base64
 
 st.set_page_config(page_title="Generate Visuals", page_icon="🖼️", layout="wide")
@@ -13,41 +17,55 @@ if not draft:
     st.warning("Please complete **Step 3 – Draft Case Study** first.")
     st.stop()
 
+def run_image_jobs(jobs: dict, captions: dict) -> int:
+    # jobs: {key: (prompt, size)}; placeholders first so each image lands in its slot as soon as it is ready
+    slots = {k: st.empty() for k in jobs}
+    for k in jobs:
+        slots[k].info(f"⏳ Generating: *{captions[k]}* …")
+    failures = st.session_state.setdefault("image_failures", {})
+    diagrams = st.session_state.setdefault("diagram_images", {})
+    ok = 0
+    with trace.step("visuals", images=len(jobs)):
+        for key, img, err in generate_images(jobs):
+            if err is not None:
+                failures[key] = {"prompt": jobs[key][0], "size": jobs[key][1], "caption": captions[key], "error": str(err)}
+                slots[key].error(f"Failed to generate '{captions[key]}': {err}")
+                continue
+            failures.pop(key, None)
+            # Session state keeps only the content id; pixels live in the shared image store
+            image_id = images.put(img)
+            if key == COVER_KEY:
+                st.session_state["cover_image"] = image_id
+            else:
+                diagrams[key] = image_id
+            slots[key].image(images.preview(image_id), caption=captions[key], use_column_width=True)
+            ok += 1
+    return ok
+
 # --- Cover image section ---
 st.subheader("Cover Illustration")
 style = st.selectbox("Style", ["flat illustration", "isometric", "line art", "minimal infographic"], index=0)
 theme = st.text_input("Theme keywords", value="public finance, collaboration, knowledge sharing, AI assistance, case studies")
+cover_job = (cover_image_prompt(style, theme), "1536x1024")
 
 if st.button("Generate Banner Image"):
-    prompt = f"A {style} depicting {theme}. Clean, professional, government context, minimal color palette."
-    try:
-        png_bytes = generate_image(prompt, size="1536x1024")
-        st.image(png_bytes, caption="Cover Image", use_column_width=True)
-        st.session_state["cover_image"] = png_bytes
+    if run_image_jobs({COVER_KEY: cover_job}, {COVER_KEY: "Cover Image"}):
         st.success("✅ Banner image generated.")
-    except Exception as e:
-        st.error(str(e))
 
 st.divider()
 
 # --- Diagram prompts section ---
 st.subheader("Auto-create Simple Diagram Prompts")
 
+fresh = st.checkbox("Regenerate (ignore cached suggestions)", value=False)
 if st.button("Suggest Diagram Prompts from Draft"):
-    p = f"""
-    From the following case study markdown, list three concise prompts for diagrams/flowcharts to visualise the process and impact.
-    Return bullet points only (max 3 prompts).
-    ---
-    {draft[:5000]}
-    ---
-    """
-    out = chat([{"role": "user", "content": p}])
+    p = diagram_prompts_prompt(draft)
+    out = st.write_stream(chat_stream([{"role": "user", "content": p}], cache=not fresh))
     st.session_state["diagram_prompts_raw"] = out
     # Parse bullet points into list
-    prompts = [line.strip("-• ").strip() for line in out.splitlines() if line.strip()]
+    prompts = parse_bullet_lines(out)
     st.session_state["diagram_prompts"] = prompts
     st.success("✅ Diagram prompts generated. Choose which to create below.")
-    st.markdown(out)
 
 # --- Show selection if prompts exist ---
 prompts = st.session_state.get("diagram_prompts", [])
@@ -58,22 +76,25 @@ if prompts:
         if st.checkbox(f"{i}. {prompt}", key=f"diag_{i}"):
             selected.append(prompt)
 
+    with_cover = st.checkbox("Also generate the cover banner in the same batch", value=False)
     if selected and st.button("🎨 Generate Selected Diagrams"):
-        generated_images = st.session_state.get("diagram_images", {})
-        for p in selected:
-            try:
-                st.write(f"Generating: *{p}* ...")
-                img_bytes = generate_image(
-                    f"Professional flowchart or process diagram showing: {p}. Use minimal style, government finance context.",
-                    size="1024x1024",
-                )
-                st.image(img_bytes, caption=p, use_column_width=True)
-                generated_images[p] = img_bytes
-            except Exception as e:
-                st.error(f"Failed to generate diagram '{p}': {e}")
+        jobs = {p: (diagram_image_prompt(p), "1024x1024") for p in selected}
+        captions = {p: p for p in selected}
+        if with_cover:
+            jobs[COVER_KEY] = cover_job
+            captions[COVER_KEY] = "Cover Image"
+        done = run_image_jobs(jobs, captions)
+        st.success(f"✅ {done}/{len(jobs)} image(s) generated.")
 
-        st.session_state["diagram_images"] = generated_images
-        st.success("✅ Selected diagrams generated.")
+# --- Retry only what failed ---
+failures = st.session_state.get("image_failures", {})
+if failures:
+    st.warning("Some images failed: " + "; ".join(f"*{f['caption']}* ({f['error'][:80]})" for f in failures.values()))
+    if st.button(f"🔁 Retry failed images ({len(failures)})"):
+        retry = dict(failures)
+        done = run_image_jobs({k: (f["prompt"], f["size"]) for k, f in retry.items()},
+                              {k: f["caption"] for k, f in retry.items()})
+        st.success(f"✅ {done}/{len(retry)} image(s) recovered.")
 
 # Reminder for next step
 if st.session_state.get("cover_image") or st.session_state.get("diagram_images"):
@@ -0,0 +1,102 @@
+import time
+import pandas as pd
+import streamlit as st
+from core.auth import require_password
+from core import scheduler, trace
+
+st.set_page_config(page_title="Metrics", page_icon="📈", layout="wide")
+require_password()
+
+st.title("📈 Metrics")
+st.caption("Per-call traces from data/traces/ (latency, tokens, payload sizes, retries, cache hits and estimated cost).")
+
+WINDOWS = {"Last hour": 3600, "Last 24 hours": 86400, "Last 7 days": 7 * 86400, "All": None}
+window = st.selectbox("Window", list(WINDOWS), index=1)
+span_s = WINDOWS[window]
+records = trace.load(since=time.time() - span_s if span_s else None)
+if not records:
+    st.info("No traces recorded in this window yet.")
+    st.stop()
+
+df = pd.DataFrame(records)
+for col in ("tokens_in", "tokens_out", "bytes_in", "bytes_out", "retries", "cost_usd", "ms", "queue_ms"):
+    if col not in df:
+        df[col] = float("nan")
+    df[col] = pd.to_numeric(df[col], errors="coerce")
+for col in ("cache_hit", "ok", "step", "error"):
+    if col not in df:
+        df[col] = None
+df["session"] = df["session"].fillna("(none)")
+df["when"] = pd.to_datetime(df["ts"], unit="s")
+calls = df[df["kind"] != "step"]
+steps = df[df["kind"] == "step"]
+
+def percentiles(frame: pd.DataFrame, by) -> pd.DataFrame:
+    g = frame.groupby(by)
+    out = g["ms"].quantile([0.5, 0.9, 0.99]).unstack()
+    out.columns = ["p50 ms", "p90 ms", "p99 ms"]
+    out.insert(0, "count", g.size())
+    out["total s"] = g["ms"].sum() / 1000.0
+    return out
+
+c1, c2, c3, c4 = st.columns(4)
+c1.metric("Traced calls", f"{len(calls):,}")
+c2.metric("Estimated cost", f"${calls['cost_usd'].sum():.2f}")
+chats = calls[calls["kind"] == "chat"]
+c3.metric("Chat cache hit rate", f"{chats['cache_hit'].fillna(False).astype(bool).mean():.0%}" if len(chats) else "–")
+c4.metric("Errors", int((df["ok"] == False).sum()))  # noqa: E712 (column may hold None)
+
+st.subheader("Calls by kind")
+by_call = percentiles(calls, ["kind", "name"])
+g = calls.groupby(["kind", "name"])
+by_call["tokens in"] = g["tokens_in"].sum()
+by_call["tokens out"] = g["tokens_out"].sum()
+by_call["MB in"] = g["bytes_in"].sum() / 1e6
+by_call["MB out"] = g["bytes_out"].sum() / 1e6
+by_call["queue p90 ms"] = g["queue_ms"].quantile(0.9)
+by_call["retries"] = g["retries"].sum()
+by_call["cache hits"] = g["cache_hit"].apply(lambda s: int(s.fillna(False).astype(bool).sum()))
+by_call["cost $"] = g["cost_usd"].sum()
+st.dataframe(by_call.round(2), use_container_width=True)
+
+st.subheader("Rate-limit queue (this process, live)")
+live = scheduler.stats()
+if live:
+    st.dataframe(pd.DataFrame.from_dict(live, orient="index"), use_container_width=True)
+else:
+    st.caption("No API calls scheduled since the app started.")
+
+st.subheader("Pipeline steps")
+if len(steps):
+    st.dataframe(percentiles(steps, "name").round(2), use_container_width=True)
+    # Where each step's time goes: call latency summed per step and kind (concurrent calls can exceed the step's wall time)
+    inner = calls.dropna(subset=["step"]).pivot_table(index="step", columns="kind", values="ms", aggfunc="sum") / 1000.0
+    if len(inner):
+        st.caption("Seconds spent in calls, per step (summed across concurrent calls)")
+        st.dataframe(inner.round(2), use_container_width=True)
+else:
+    st.caption("No pipeline steps recorded in this window.")
+
+st.subheader("Sessions")
+sg = df.groupby("session")
+sessions = pd.DataFrame({
+    "last seen": sg["when"].max(),
+    "calls": calls.groupby("session").size(),
+    "steps": steps.groupby("session").size(),
+    "step time s": steps.groupby("session")["ms"].sum() / 1000.0,
+    "cost $": calls.groupby("session")["cost_usd"].sum(),
+    "errors": sg["ok"].apply(lambda s: int((s == False).sum())),  # noqa: E712
+}).fillna(0).sort_values("last seen", ascending=False)
+st.dataframe(sessions.round({"step time s": 2, "cost $": 4}), use_container_width=True)
+
+pick = st.selectbox("Session detail", list(sessions.index))
+if pick:
+    sel = df[df["session"] == pick]
+    st.dataframe(percentiles(sel, ["step", "kind"]).round(2) if sel["step"].notna().any() else percentiles(sel, "kind").round(2),
+                 use_container_width=True)
+
+errors = df[df["ok"] == False]  # noqa: E712
+if len(errors):
+    st.subheader("Recent errors")
+    st.dataframe(errors.sort_values("ts", ascending=False).head(50)[["when", "session", "step", "kind", "name", "error"]],
+                 hide_index=True, use_container_width=True)